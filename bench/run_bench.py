@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import quantiles
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.json')
+SERVE = os.path.join(ROOT, 'common', 'serve.py')
+# Команда запуска сервиса: {file} - имя файла сервиса (запуск из его каталога), {port} - его порт
+DEFAULT_COMMAND = '{python} {file}'
+SERVE_COMMAND = '{python} ' + SERVE + ' {file} --bind 127.0.0.1:{port} --workers {workers} --threads {threads}'
+
+
+def port_is_open(port, host='127.0.0.1'):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex((host, port)) == 0
+
+
+# Группы с requires_db пишут в базу тестовые строки, поэтому запускаются только
+# на отдельной базе: ее имя задается BENCH_DB_NAME и передается сервисам как DB_NAME
+BENCH_DB_ENV = 'BENCH_DB_NAME'
+
+
+# Проверка доступности PostgreSQL с параметрами из переменных окружения (DB_HOST и т.д.)
+def database_available(db_name):
+    try:
+        import psycopg2
+        psycopg2.connect(
+            host=os.getenv('DB_HOST'),
+            database=db_name,
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            connect_timeout=3
+        ).close()
+    except Exception as e:
+        return str(e).strip()
+    return None
+
+
+# Запуск сервисов группы из каталога файла сервиса по шаблону команды command.
+# Каждый сервис запускается в своей группе процессов, чтобы остановить и дочерние процессы
+# (перезагрузчик Flask в режиме debug, рабочие процессы gunicorn).
+class Services:
+    def __init__(self, services, command, startup_timeout, log_dir, env=None):
+        self.services = services
+        self.env = env or {}
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.log_dir = log_dir
+        self.processes = []
+
+    def start(self):
+        for service in self.services:
+            if port_is_open(service['port']):
+                raise RuntimeError(f"port {service['port']} is already in use")
+
+        for service in self.services:
+            path = os.path.join(ROOT, service['file'])
+            log_path = os.path.join(self.log_dir, os.path.basename(path) + '.log')
+            log = open(log_path, 'ab')
+            process = subprocess.Popen(
+                [part.format(python=sys.executable, file=os.path.basename(path), port=service['port'])
+                 for part in self.command.split()],
+                cwd=os.path.dirname(path),
+                env={**os.environ, **self.env, 'PYTHONUNBUFFERED': '1'},
+                stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+            self.processes.append((service, process, log, log_path))
+
+        deadline = time.monotonic() + self.startup_timeout
+        for service, process, _, log_path in self.processes:
+            while not port_is_open(service['port']):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    with open(log_path, encoding='utf-8', errors='replace') as f:
+                        tail = f.read()[-2000:]
+                    raise RuntimeError(f"{service['file']} did not start on port {service['port']}:\n{tail}")
+                time.sleep(0.1)
+
+    def stop(self):
+        for _, process, log, _ in self.processes:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for _, process, log, _ in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            log.close()
+        self.processes = []
+
+
+def request_url(spec, default_port):
+    return f"http://127.0.0.1:{spec.get('port', default_port)}{spec['path']}"
+
+
+async def send(session, spec, default_port):
+    kwargs = {}
+    if 'json' in spec:
+        kwargs['json'] = spec['json']
+    if 'data' in spec:
+        kwargs['data'] = spec['data'].encode('utf-8')
+    async with session.request(spec['method'], request_url(spec, default_port), **kwargs) as response:
+        await response.read()
+        return response.status
+
+
+# Нагрузка: concurrency одновременных клиентов в течение warmup + duration секунд.
+# Каждый клиент выбирает запрос случайно с учетом весов из сценария.
+# Учитываются только запросы, начатые после прогрева.
+# Запросы teardown убирают созданные setup данные и выполняются даже после ошибки.
+async def drive(group, concurrency, duration, warmup, seed):
+    requests = group['requests']
+    default_port = group['services'][0]['port']
+    weights = [spec.get('weight', 1) for spec in requests]
+    samples = {spec['name']: [] for spec in requests}
+    statuses = {spec['name']: {} for spec in requests}
+    errors = {spec['name']: 0 for spec in requests}
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for spec in group.get('setup', []):
+            await send(session, spec, default_port)
+
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        async def client(rng):
+            while True:
+                spec = rng.choices(requests, weights)[0]
+                begin = time.perf_counter()
+                if begin >= stop_at:
+                    return
+                try:
+                    status = await send(session, spec, default_port)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - begin
+                if begin < measure_from:
+                    continue
+                name = spec['name']
+                samples[name].append(elapsed)
+                statuses[name][str(status)] = statuses[name].get(str(status), 0) + 1
+                if not isinstance(status, int) or status >= 500:
+                    errors[name] += 1
+
+        try:
+            await asyncio.gather(*(client(random.Random(seed + i)) for i in range(concurrency)))
+        finally:
+            for spec in group.get('teardown', []):
+                await send(session, spec, default_port)
+
+    return {name: summarize(samples[name], statuses[name], errors[name], duration) for name in samples}
+
+
+def summarize(latencies, statuses, errors, duration):
+    result = {'requests': len(latencies), 'errors': errors, 'statuses': statuses,
+              'rps': round(len(latencies) / duration, 1)}
+    if len(latencies) >= 2:
+        cuts = quantiles(latencies, n=100, method='inclusive')
+        result['latency_ms'] = {
+            'p50': round(cuts[49] * 1000, 3),
+            'p95': round(cuts[94] * 1000, 3),
+            'p99': round(cuts[98] * 1000, 3),
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3),
+        }
+    return result
+
+
+# Сравнение с сохраненным результатом: регрессия, если p95 вырос или RPS упал больше чем на tolerance
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for group_name, group in results['groups'].items():
+        base_group = baseline.get('groups', {}).get(group_name, {})
+        for name, current in group.get('endpoints', {}).items():
+            base = base_group.get('endpoints', {}).get(name)
+            if not base or 'latency_ms' not in base or 'latency_ms' not in current:
+                continue
+            if current['latency_ms']['p95'] > base['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append(f"{group_name} {name}: p95 {base['latency_ms']['p95']} -> "
+                                   f"{current['latency_ms']['p95']} ms")
+            if current['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{group_name} {name}: rps {base['rps']} -> {current['rps']}")
+    return regressions
+
+
+def run_groups(scenarios, names, command, args, log_dir):
+    groups = {}
+    for name in names:
+        group = scenarios[name]
+        env = {}
+        if group.get('requires_db'):
+            db_name = os.getenv(BENCH_DB_ENV)
+            if not db_name:
+                groups[name] = {'skipped': f"set {BENCH_DB_ENV} to a dedicated database, the group writes test data"}
+                continue
+            problem = database_available(db_name)
+            if problem:
+                groups[name] = {'skipped': f"PostgreSQL unavailable: {problem}"}
+                continue
+            env['DB_NAME'] = db_name
+
+        services = Services(group['services'], command, args.startup_timeout, log_dir, env)
+        try:
+            services.start()
+            endpoints = asyncio.run(drive(group, args.concurrency, args.duration, args.warmup, args.seed))
+            groups[name] = {'endpoints': endpoints}
+        except RuntimeError as e:
+            groups[name] = {'skipped': str(e)}
+        finally:
+            services.stop()
+        print(f"{name}: done", file=sys.stderr)
+    return groups
+
+
+# Пропускная способность групп при разном числе рабочих процессов production-сервера.
+# speedup - отношение суммарного RPS к RPS при первом числе процессов из списка
+def measure_scaling(scenarios, names, args, log_dir):
+    scaling = {}
+    for workers in [int(value) for value in args.workers.split(',')]:
+        command = SERVE_COMMAND.replace('{workers}', str(workers)).replace('{threads}', str(args.threads))
+        for name, group in run_groups(scenarios, names, command, args, log_dir).items():
+            runs = scaling.setdefault(name, {})
+            if 'skipped' in group:
+                runs[str(workers)] = group
+                continue
+            endpoints = group['endpoints']
+            total = round(sum(endpoint['rps'] for endpoint in endpoints.values()), 1)
+            runs[str(workers)] = {'rps': total, 'endpoints': endpoints}
+
+    for runs in scaling.values():
+        measured = [run for run in runs.values() if 'rps' in run]
+        if measured and measured[0]['rps']:
+            for run in measured:
+                run['speedup'] = round(run['rps'] / measured[0]['rps'], 2)
+    return scaling
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование Flask-сервисов репозитория")
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help="файл сценариев JSON")
+    parser.add_argument('--groups', help="группы через запятую (по умолчанию все)")
+    parser.add_argument('--concurrency', type=int, default=16, help="число одновременных клиентов")
+    parser.add_argument('--duration', type=float, default=10, help="длительность замера, сек")
+    parser.add_argument('--warmup', type=float, default=1, help="прогрев перед замером, сек")
+    parser.add_argument('--seed', type=int, default=1, help="зерно выбора запросов")
+    parser.add_argument('--startup-timeout', type=float, default=20, help="ожидание запуска сервиса, сек")
+    parser.add_argument('--command', default=DEFAULT_COMMAND,
+                        help="шаблон команды запуска сервиса с подстановками {python}, {file}, {port}")
+    parser.add_argument('--workers',
+                        help="проверка масштабирования: числа процессов через запятую (1,2,4), "
+                             "сервисы запускаются через common/serve.py")
+    parser.add_argument('--threads', type=int, default=4, help="потоков в процессе для --workers")
+    parser.add_argument('--output', help="файл для результата (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="результат прошлого запуска для поиска регрессий")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    with open(args.scenarios, encoding='utf-8') as f:
+        scenarios = json.load(f)
+    names = args.groups.split(',') if args.groups else list(scenarios)
+
+    results = {
+        'settings': {'concurrency': args.concurrency, 'duration': args.duration,
+                     'warmup': args.warmup, 'cpu_count': os.cpu_count(), 'command': args.command},
+    }
+    log_dir = tempfile.mkdtemp(prefix='bench_')
+    if args.workers:
+        results['settings']['command'] = SERVE_COMMAND
+        results['scaling'] = measure_scaling(scenarios, names, args, log_dir)
+    else:
+        results['groups'] = run_groups(scenarios, names, args.command, args, log_dir)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    print(f"service logs: {log_dir}", file=sys.stderr)
+
+    if args.baseline and 'groups' in results:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+# Общие модули ботов и сервисов. Пакет устанавливается один раз из корня репозитория:
+#   pip install -e .
+# после чего import common работает из любого каталога лабораторной.
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timezone
+
+# Схема таблицы currencies с номером версии, общая для бота lab5 и сервисов lab6
+
+# Канал уведомлений об изменении таблицы currencies
+CHANNEL = 'currencies_changed'
+
+# Таблица версий и триггер: любая запись в currencies увеличивает версию, запоминает
+# время изменения и отправляет NOTIFY с новым номером (уведомление доставляется после COMMIT).
+# Схема создается в одной транзакции под advisory-блокировкой: процессы gunicorn
+# запускаются одновременно, а параллельные CREATE OR REPLACE FUNCTION и создание
+# триггера в PostgreSQL завершаются ошибкой (tuple concurrently updated)
+SCHEMA_SQL = f"""
+    SELECT pg_advisory_xact_lock(hashtext('currencies_schema'));
+
+    CREATE TABLE IF NOT EXISTS currencies (
+        id SERIAL PRIMARY KEY,
+        currency_name VARCHAR(10) UNIQUE NOT NULL,
+        rate NUMERIC(10, 2) NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS currencies_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version BIGINT NOT NULL
+    );
+
+    ALTER TABLE currencies_version ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+    INSERT INTO currencies_version (id, version) VALUES (1, 1) ON CONFLICT (id) DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION notify_currencies_changed() RETURNS trigger AS $$
+    DECLARE
+        new_version BIGINT;
+    BEGIN
+        UPDATE currencies_version SET version = version + 1, changed_at = now() WHERE id = 1
+            RETURNING version INTO new_version;
+        PERFORM pg_notify('{CHANNEL}', new_version::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'currencies_changed') THEN
+            CREATE TRIGGER currencies_changed
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON currencies
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_currencies_changed();
+        END IF;
+    END
+    $$;
+"""
+
+# Версия и содержимое таблицы читаются одним запросом, чтобы они соответствовали друг другу
+LOAD_SQL = """
+    SELECT v.version, v.changed_at, c.currency_name, c.rate
+    FROM currencies_version v
+    LEFT JOIN currencies c ON TRUE
+    WHERE v.id = 1
+    ORDER BY c.currency_name
+"""
+
+
+# Снимок таблицы currencies с номером версии и временем последнего изменения.
+# Ответ /currencies сериализуется один раз на снимок; ETag - номер версии,
+# общий для всех процессов сервиса, так как версия хранится в базе данных.
+class RateSnapshot:
+    def __init__(self, version, rows, changed_at=None):
+        self.version = version
+        self.rows = rows
+        self.rates = {name: float(rate) for name, rate in rows}
+        self.loaded_at = datetime.now(timezone.utc)
+        self.changed_at = changed_at or self.loaded_at
+        self.etag = str(version)
+        self._body = None
+
+    # Список валют в JSON: [[название, курс строкой], ...]
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = json.dumps([[name, str(rate)] for name, rate in self.rows],
+                                    separators=(',', ':')).encode()
+        return self._body
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+# Один файл SQLite (шард) с таблицей состояний FSM
+class _Shard:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL позволяет нескольким процессам бота читать файл, пока другой пишет
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def execute(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+
+# Хранилище состояний FSM для aiogram в локальных файлах SQLite.
+# Ключи распределяются по shards файлам по chat_id, поэтому записи разных чатов
+# не конкурируют за одну блокировку файла. Состояния, не обновлявшиеся дольше ttl секунд,
+# считаются устаревшими: они не возвращаются и периодически удаляются.
+# Обращения к диску выполняются в пуле потоков и не блокируют цикл событий.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, directory, shards=4, ttl=7 * 24 * 3600, cleanup_interval=3600):
+        os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._shards = [_Shard(os.path.join(directory, f"fsm_{i}.sqlite3")) for i in range(shards)]
+        self._last_cleanup = 0.0
+
+    def _shard(self, key):
+        return self._shards[zlib.crc32(str(key.chat_id).encode()) % len(self._shards)]
+
+    def _expired_before(self):
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def _read(self, key):
+        rows = self._shard(key).execute(
+            "SELECT state, data FROM fsm WHERE key = ? AND updated_at >= ?",
+            (self.key_builder.build(key), self._expired_before())
+        )
+        return rows[0] if rows else (None, None)
+
+    # Запись состояния или данных. Если прежняя запись устарела, второй столбец
+    # сбрасывается в той же операции, иначе обновление updated_at вернуло бы его из небытия
+    def _write(self, key, column, value):
+        other = 'data' if column == 'state' else 'state'
+        self._shard(key).execute(
+            f"INSERT INTO fsm (key, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT (key) DO UPDATE SET {column} = excluded.{column}, "
+            f"{other} = CASE WHEN fsm.updated_at < ? THEN NULL ELSE fsm.{other} END, "
+            f"updated_at = excluded.updated_at",
+            (self.key_builder.build(key), value, time.time(), self._expired_before())
+        )
+        self._maybe_cleanup()
+
+    # Удаление устаревших и пустых состояний не чаще раза в cleanup_interval секунд
+    def _maybe_cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        for shard in self._shards:
+            shard.execute(
+                "DELETE FROM fsm WHERE updated_at < ? OR (state IS NULL AND (data IS NULL OR data = '{}'))",
+                (self._expired_before(),)
+            )
+
+    async def set_state(self, key, state=None):
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(self._write, key, 'state', value)
+
+    async def get_state(self, key):
+        state, _ = await asyncio.to_thread(self._read, key)
+        return state
+
+    async def set_data(self, key, data):
+        await asyncio.to_thread(self._write, key, 'data', json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key):
+        _, data = await asyncio.to_thread(self._read, key)
+        return json.loads(data) if data else {}
+
+    async def close(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.conn.close()
+
+
+# Хранилище FSM по переменной окружения FSM_STORAGE:
+#   sqlite:<каталог> - файлы SQLite (по умолчанию sqlite:fsm_state),
+#   redis://...      - Redis или совместимый сервер (нужен пакет redis),
+#   memory           - в памяти процесса, как раньше.
+def create_storage():
+    url = os.getenv('FSM_STORAGE', 'sqlite:fsm_state')
+    ttl = int(os.getenv('FSM_STATE_TTL', str(7 * 24 * 3600)))
+
+    if url == 'memory':
+        return MemoryStorage()
+
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(url, state_ttl=ttl, data_ttl=ttl)
+
+    if url.startswith('sqlite:'):
+        shards = int(os.getenv('FSM_STORAGE_SHARDS', '4'))
+        return SQLiteStorage(url[len('sqlite:'):] or 'fsm_state', shards=shards, ttl=ttl)
+
+    logging.warning("Неизвестное хранилище FSM %r, используется хранение в памяти", url)
+    return MemoryStorage()
@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+# Ротация по размеру (байты) или, если задан LOG_ROTATE_WHEN (например midnight), по времени
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+# Доля записываемых сообщений уровня INFO и ниже (1 - все, 0.1 - каждое десятое)
+LOG_INFO_SAMPLE_RATE = float(os.getenv('LOG_INFO_SAMPLE_RATE', '1'))
+# Сколько записей может ждать записи на диск; при переполнении новые записи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Сколько разных шаблонов сообщений помнит выборка; при переполнении счетчики начинаются заново
+LOG_SAMPLE_MAX_KEYS = int(os.getenv('LOG_SAMPLE_MAX_KEYS', '1000'))
+# Сколько секунд при завершении процесса ждать, пока поток записи сбросит очередь на диск
+LOG_STOP_TIMEOUT = float(os.getenv('LOG_STOP_TIMEOUT', '5'))
+
+# Стандартные атрибуты LogRecord; остальные (переданные через extra) попадают в JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+# Одна запись журнала - одна строка JSON
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Выборка частых сообщений: из записей уровня INFO и ниже с одним шаблоном
+# пропускается каждая N-я (первая всегда). Предупреждения и ошибки не отбрасываются.
+# Счетчики хранятся не более чем для max_keys шаблонов, чтобы сообщения, собранные
+# без аргументов (f-строки), не занимали память без ограничения.
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate, max_keys=LOG_SAMPLE_MAX_KEYS):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.max_keys = max_keys
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        if not self.every:
+            return False
+        if record.msg not in self._counts and len(self._counts) >= self.max_keys:
+            self._counts.clear()
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+# Постановка записи в очередь без ожидания. Сообщение форматируется уже в потоке записи:
+# очередь находится в памяти процесса, поэтому запись передается как есть.
+# Если очередь заполнена (диск не успевает), запись отбрасывается, а не блокирует бота.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Остановка потока записи, которая не может зависнуть при завершении процесса.
+# Стандартный stop() ставит маркер остановки в очередь с ожиданием, и при заполненной
+# очереди и медленном диске atexit ждал бы без ограничения. Здесь маркер ставится без
+# ожидания (при необходимости вместо самой старой записи), а поток ждется не дольше timeout.
+class NonBlockingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+    def stop(self, timeout=LOG_STOP_TIMEOUT):
+        if self._thread is None:
+            return
+        self.enqueue_sentinel()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+def _file_handler(filename):
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            filename, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(
+        filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+
+
+# Настройка корневого логгера: обработчики в потоке бота только кладут записи в очередь,
+# а отдельный поток QueueListener форматирует их в JSON и пишет в файл с ротацией
+def setup_logging(filename='bot.log', level=logging.INFO):
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_INFO_SAMPLE_RATE))
+
+    file_handler = _file_handler(filename)
+    file_handler.setFormatter(JsonFormatter())
+    listener = NonBlockingQueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # При завершении процесса оставшиеся в очереди записи сбрасываются на диск
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    return listener
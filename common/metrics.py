@@ -0,0 +1,258 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+# Порт отдельного HTTP-сервера метрик; если не задан, сервер не запускается
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+
+# Границы корзин гистограмм времени выполнения (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Набор метрик процесса, отдаваемый в текстовом формате Prometheus
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# Базовый класс метрики: значения хранятся по кортежу значений меток
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _add(self, labels, amount):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(tuple(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in values]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        self._add(tuple(labels), amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, labels=(), amount=1):
+        self._add(tuple(labels), amount)
+
+    def dec(self, labels=(), amount=1):
+        self._add(tuple(labels), -amount)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[tuple(labels)] = value
+
+
+# Гистограмма: число наблюдений в каждой корзине, сумма и количество
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[labels] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', le)])} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {round(total, 6)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+# Метрика, значения которой читаются из источника при каждой выдаче /metrics:
+# collect возвращает словарь {кортеж значений меток: значение}
+class CollectedMetric(_Metric):
+    def __init__(self, name, help, kind, collect, labels=(), registry=REGISTRY):
+        self.kind = kind
+        self.collect = collect
+        super().__init__(name, help, labels, registry)
+
+    def samples(self):
+        values = sorted(self.collect().items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in values]
+
+
+# Кэши (TTLCache), счетчики которых публикуются в /metrics, по именам
+_CACHES = {}
+
+
+def _cache_stat(key):
+    return lambda: {(name,): cache.stats()[key] for name, cache in list(_CACHES.items())}
+
+
+# Публикация счетчиков кэша под меткой cache=name
+def register_cache(name, cache):
+    _CACHES[name] = cache
+    return cache
+
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время работы обработчика', ('handler', 'state'))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках', ('handler', 'state', 'error'))
+HANDLERS_IN_FLIGHT = Gauge('bot_handlers_in_flight', 'Выполняющиеся обработчики', ('handler',))
+CALL_SECONDS = Histogram('bot_external_call_seconds', 'Время обращений к БД и сервисам', ('kind', 'name'))
+CALL_ERRORS = Counter('bot_external_call_errors_total', 'Ошибки обращений к БД и сервисам', ('kind', 'name', 'error'))
+CACHE_HITS = CollectedMetric('bot_cache_hits_total', 'Попадания в кэш', 'counter', _cache_stat('hits'), ('cache',))
+CACHE_MISSES = CollectedMetric('bot_cache_misses_total', 'Промахи кэша', 'counter', _cache_stat('misses'), ('cache',))
+CACHE_EVICTIONS = CollectedMetric('bot_cache_evictions_total', 'Вытеснения из кэша', 'counter',
+                                  _cache_stat('evictions'), ('cache',))
+CACHE_EXPIRATIONS = CollectedMetric('bot_cache_expirations_total', 'Устаревшие записи кэша', 'counter',
+                                    _cache_stat('expirations'), ('cache',))
+CACHE_SIZE = CollectedMetric('bot_cache_entries', 'Записей в кэше', 'gauge', _cache_stat('size'), ('cache',))
+
+
+# Middleware aiogram: время, ошибки и число выполняющихся вызовов для каждого
+# обработчика и состояния FSM, в котором он вызван
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object is not None else 'unknown'
+        state = data.get('raw_state') or 'none'
+
+        HANDLERS_IN_FLIGHT.inc((name,))
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc((name, state, type(e).__name__))
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, (name, state))
+            HANDLERS_IN_FLIGHT.dec((name,))
+
+
+# Замер обращения к внешней системе: with track_call('db', 'fetch_operations'): ...
+@contextmanager
+def track_call(kind, name):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        CALL_ERRORS.inc((kind, name, type(e).__name__))
+        raise
+    finally:
+        CALL_SECONDS.observe(time.perf_counter() - started, (kind, name))
+
+
+# Декоратор для замера синхронных и асинхронных функций, имя метрики - имя функции
+def timed(kind, name=None):
+    def decorator(func):
+        call_name = name or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_call(kind, call_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_call(kind, call_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def handle_metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type='text/plain')
+
+
+# Подключение метрик к диспетчеру: middleware для сообщений и нажатий кнопок
+# и, если задан METRICS_PORT, HTTP-сервер с /metrics на время работы бота
+def setup_metrics(dp):
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    if not METRICS_PORT:
+        return
+
+    runner = None
+
+    async def start_server():
+        nonlocal runner
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, METRICS_HOST, int(METRICS_PORT)).start()
+        logging.info("Метрики доступны на %s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+    async def stop_server():
+        if runner is not None:
+            await runner.cleanup()
+
+    dp.startup.register(start_server)
+    dp.shutdown.register(stop_server)
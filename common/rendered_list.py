@@ -0,0 +1,57 @@
+import time
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+# Разбиение строк на тексты сообщений не длиннее limit. Сообщения делятся
+# по границам строк, слишком длинная строка режется на части.
+def split_message(lines, limit=MESSAGE_LIMIT):
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        for piece in [line[i:i + limit] for i in range(0, len(line), limit)] or ['']:
+            added = len(piece) + (1 if current else 0)
+            if current and size + added > limit:
+                chunks.append("\n".join(current))
+                current, size, added = [], 0, len(piece)
+            current.append(piece)
+            size += added
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# Готовый к отправке список (тексты сообщений) и версия данных, по которой он построен.
+# В течение ttl секунд после построения или проверки версии список отдается из памяти;
+# по истечении срока вызывающий сверяет версию с источником (confirm) или строит список заново.
+# Изменения, сделанные самим ботом, сбрасывают список сразу (invalidate).
+class RenderedList:
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self.version = None
+        self.chunks = None
+        self._checked_at = 0.0
+
+    # Список, если срок проверки не истек, иначе None
+    def fresh(self):
+        if self.chunks is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self.chunks
+        return None
+
+    # Версия в источнике не изменилась: список снова считается свежим
+    def confirm(self, version):
+        if self.chunks is None or version != self.version:
+            return None
+        self._checked_at = time.monotonic()
+        return self.chunks
+
+    def set(self, version, chunks):
+        self.version = version
+        self.chunks = chunks
+        self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self.version = None
+        self.chunks = None
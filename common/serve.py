@@ -0,0 +1,96 @@
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+# Загрузка Flask-приложения app из файла сервиса. Каталог файла добавляется в sys.path,
+# чтобы работали импорты соседних модулей (например, from db_pool import pool).
+# Если в модуле есть функция startup (прогрев пула, загрузка кэшей), она вызывается;
+# при запуске напрямую сервис вызывает ее сам в блоке __main__.
+def load_app(path):
+    path = os.path.abspath(path)
+    directory, filename = os.path.split(path)
+    name = os.path.splitext(filename)[0]
+    if not name.isidentifier():
+        name = f"service_{name}"
+
+    sys.path.insert(0, directory)
+    os.chdir(directory)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    if hasattr(module, 'startup'):
+        module.startup()
+    return module.app
+
+
+if BaseApplication is not None:
+    # Приложение gunicorn: каждый рабочий процесс сам загружает сервис после fork,
+    # поэтому соединения с БД и фоновые потоки у процессов свои
+    class ServiceApplication(BaseApplication):
+        def __init__(self, path, options):
+            self.path = path
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_app(self.path)
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Запуск Flask-сервиса репозитория в production-сервере")
+    parser.add_argument('service', help="файл сервиса, например lab6/data_manager.py")
+    parser.add_argument('--bind', default=os.getenv('SERVE_BIND', '127.0.0.1:5000'), help="адрес host:port")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVE_WORKERS', str(2 * cpu_count + 1))),
+                        help="число рабочих процессов")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVE_THREADS', '4')),
+                        help="число потоков в процессе")
+    parser.add_argument('--keepalive', type=int, default=int(os.getenv('SERVE_KEEPALIVE', '5')),
+                        help="время удержания keep-alive соединения, сек")
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('SERVE_TIMEOUT', '30')),
+                        help="перезапуск зависшего процесса через, сек")
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('SERVE_GRACEFUL_TIMEOUT', '30')),
+                        help="время на завершение запросов при остановке и перезагрузке, сек")
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('SERVE_MAX_REQUESTS', '0')),
+                        help="перезапуск процесса после стольких запросов (0 - без ограничения)")
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        # Без gunicorn остается многопоточный сервер werkzeug в одном процессе
+        logging.warning("gunicorn не установлен, сервис запускается в одном процессе werkzeug")
+        host, _, port = args.bind.rpartition(':')
+        load_app(args.service).run(host=host or '127.0.0.1', port=int(port), threaded=True)
+        return
+
+    # Плавная перезагрузка: kill -HUP <pid главного процесса> - новые процессы запускаются,
+    # старые дообрабатывают запросы в течение graceful_timeout
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+    }
+    ServiceApplication(args.service, options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from common.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# Тест сохранения состояния и данных
+def test_state_and_data(tmp_path):
+    storage = SQLiteStorage(tmp_path, shards=2)
+    run(storage.set_state(KEY, 'form:name'))
+    run(storage.set_data(KEY, {'x': 1}))
+    assert run(storage.get_state(KEY)) == 'form:name'
+    assert run(storage.get_data(KEY)) == {'x': 1}
+    run(storage.close())
+
+# Тест устаревшего состояния: не возвращается после ttl
+def test_expired_state_hidden(tmp_path):
+    storage = SQLiteStorage(tmp_path, ttl=0.2)
+    run(storage.set_state(KEY, 'form:name'))
+    run(storage.set_data(KEY, {'x': 1}))
+    time.sleep(0.3)
+    assert run(storage.get_state(KEY)) is None
+    assert run(storage.get_data(KEY)) == {}
+    run(storage.close())
+
+# Тест записи после истечения ttl: устаревшие данные не возвращаются вместе с новым состоянием
+def test_set_state_after_expiry_drops_old_data(tmp_path):
+    storage = SQLiteStorage(tmp_path, ttl=0.2)
+    run(storage.set_data(KEY, {'x': 1}))
+    time.sleep(0.3)
+    run(storage.set_state(KEY, 'form:name'))
+    assert run(storage.get_state(KEY)) == 'form:name'
+    assert run(storage.get_data(KEY)) == {}
+    run(storage.close())
+
+# Тест записи данных после истечения ttl: устаревшее состояние сбрасывается
+def test_set_data_after_expiry_drops_old_state(tmp_path):
+    storage = SQLiteStorage(tmp_path, ttl=0.2)
+    run(storage.set_state(KEY, 'form:name'))
+    time.sleep(0.3)
+    run(storage.set_data(KEY, {'y': 2}))
+    assert run(storage.get_state(KEY)) is None
+    assert run(storage.get_data(KEY)) == {'y': 2}
+    run(storage.close())
@@ -0,0 +1,50 @@
+import logging
+import queue
+import threading
+import time
+
+from common.log_setup import NonBlockingQueueListener, SamplingFilter
+
+
+def record(msg, level=logging.INFO):
+    return logging.makeLogRecord({'msg': msg, 'levelno': level})
+
+
+# Обработчик, который "застрял" на записи, пока не открыт unblock
+class StuckHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.unblock.wait()
+
+
+# Тест выборки: пропускается каждое N-е сообщение с одним шаблоном, ошибки - все
+def test_sampling_every_nth():
+    sampling = SamplingFilter(0.5)
+    assert [sampling.filter(record("tick")) for _ in range(4)] == [True, False, True, False]
+    assert all(sampling.filter(record("tick", logging.ERROR)) for _ in range(3))
+
+# Тест ограничения числа шаблонов в счетчиках выборки
+def test_sampling_counts_bounded():
+    sampling = SamplingFilter(0.5, max_keys=3)
+    for i in range(10):
+        sampling.filter(record(f"user {i}"))
+    assert len(sampling._counts) <= 3
+
+# Тест остановки при заполненной очереди и зависшей записи на диск: stop() не ждет без ограничения
+def test_stop_with_full_queue_does_not_hang():
+    log_queue = queue.Queue(maxsize=2)
+    handler = StuckHandler()
+    listener = NonBlockingQueueListener(log_queue, handler)
+    listener.start()
+    log_queue.put(record("first"))
+    time.sleep(0.05)
+    log_queue.put(record("second"))
+    log_queue.put(record("third"))
+
+    started = time.monotonic()
+    listener.stop(timeout=0.2)
+    assert time.monotonic() - started < 1
+    handler.unblock.set()
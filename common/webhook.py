@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+import zlib
+
+from aiohttp import web
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from common.metrics import Counter, Gauge, Histogram, handle_metrics
+
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+# Число обработчиков и длина очереди каждого из них
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# Сколько секунд при остановке дожидаться обработки уже принятых обновлений
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '10'))
+
+UPDATES = Counter('bot_webhook_updates_total', 'Обновления, полученные через webhook', ('result',))
+UPDATE_ERRORS = Counter('bot_webhook_errors_total', 'Обновления, обработка которых завершилась ошибкой')
+QUEUE_DEPTH = Gauge('bot_webhook_queue_depth', 'Обновления, ожидающие обработки')
+QUEUE_WAIT_SECONDS = Histogram('bot_webhook_queue_wait_seconds', 'Время ожидания обновления в очереди')
+PROCESS_SECONDS = Histogram('bot_webhook_process_seconds', 'Время обработки обновления')
+
+
+# Распределение обновлений Telegram по очередям обработчиков.
+# Обновления одного чата всегда попадают в одну очередь и обрабатываются по порядку,
+# разные чаты обрабатываются параллельно. Если очередь переполнена, обновление
+# не принимается и Telegram повторит его доставку позже.
+class UpdateQueue:
+    def __init__(self, dp, bot, workers, queue_size):
+        self.dp = dp
+        self.bot = bot
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._tasks = []
+
+    # Ключ упорядочивания: чат, иначе пользователь, иначе само обновление
+    @staticmethod
+    def _order_key(update):
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.chat_id is not None:
+            return context.chat_id
+        if context.user_id is not None:
+            return context.user_id
+        return update.update_id
+
+    def put(self, update):
+        queue = self.queues[zlib.crc32(str(self._order_key(update)).encode()) % len(self.queues)]
+        try:
+            queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            UPDATES.inc(('rejected',))
+            return False
+        UPDATES.inc(('accepted',))
+        QUEUE_DEPTH.inc()
+        return True
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self.queues]
+
+    async def _work(self, queue):
+        while True:
+            enqueued_at, update = await queue.get()
+            started = time.monotonic()
+            QUEUE_DEPTH.dec()
+            QUEUE_WAIT_SECONDS.observe(started - enqueued_at)
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                UPDATE_ERRORS.inc()
+                logging.error("Ошибка при обработке обновления %s: %r", update.update_id, e)
+            finally:
+                PROCESS_SECONDS.observe(time.monotonic() - started)
+                queue.task_done()
+
+    # Остановка: дожидаемся обработки принятых обновлений не дольше timeout секунд
+    async def stop(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Не обработано обновлений при остановке: %s", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+
+def create_app(updates, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    # Прием обновления: проверка секрета, постановка в очередь и немедленный ответ Telegram
+    async def handle_update(request):
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': updates.bot})
+        except ValueError:
+            return web.Response(status=400)
+        if not updates.put(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+# Запуск бота в режиме webhook: Telegram отправляет обновления на url + WEBHOOK_PATH,
+# а их обработкой занимаются WEBHOOK_WORKERS обработчиков. Работает до отмены задачи.
+async def run_webhook(dp, bot, url):
+    updates = UpdateQueue(dp, bot, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    runner = web.AppRunner(create_app(updates))
+    workflow_data = {'dispatcher': dp, 'bots': [bot], 'bot': bot, **dp.workflow_data}
+
+    await dp.emit_startup(**workflow_data)
+    updates.start()
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await bot.set_webhook(
+            url.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=100
+        )
+        logging.info("Webhook запущен на %s:%s%s, обработчиков: %s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_WORKERS)
+        await asyncio.Event().wait()
+    finally:
+        # Новые обновления больше не принимаются, принятые дообрабатываются
+        await runner.cleanup()
+        await updates.stop(WEBHOOK_DRAIN_TIMEOUT)
+        try:
+            await bot.delete_webhook()
+        except Exception as e:
+            logging.error("Не удалось удалить webhook: %r", e)
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
@@ -1,36 +1,76 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import Flask, request, jsonify
 import requests
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
 SERVICE2_URL = "http://localhost:5001/count_abc"
 SERVICE3_URL = "http://localhost:5002/count_chars"
 
+# Таймауты обращения к сервисам (секунды)
+SERVICE2_TIMEOUT = float(os.getenv('SERVICE2_TIMEOUT', '2'))
+SERVICE3_TIMEOUT = float(os.getenv('SERVICE3_TIMEOUT', '2'))
+
+# Общая сессия с пулом keep-alive соединений к сервисам
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# Потоки для параллельных запросов к сервисам
+executor = ThreadPoolExecutor(max_workers=32)
+
+# Запрос к сервису; возвращает число из ответа и время запроса в миллисекундах
+def call_service(url, input_string, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(url, json={'string': input_string}, timeout=timeout)
+        count = response.json().get('count', 0) if response.status_code == 200 else 0
+        return count, (time.perf_counter() - started) * 1000
+    except requests.exceptions.RequestException:
+        return None, (time.perf_counter() - started) * 1000
+
 @app.route('/process_string', methods=['POST'])
 def process_string():
     data = request.json
     input_string = data.get('string', '')
-    
-    try:
-        # Запрос к Сервису 2
-        abc_response = requests.post(SERVICE2_URL, json={'string': input_string})
-        abc_count = abc_response.json().get('count', 0) if abc_response.status_code == 200 else 0
-        
-        # Запрос к Сервису 3
-        chars_response = requests.post(SERVICE3_URL, json={'string': input_string})
-        char_count = chars_response.json().get('count', 0) if chars_response.status_code == 200 else 0
-        
-        return jsonify({
-            'abc_count': abc_count,
-            'char_count': char_count,
-            'status': 'success'
-        })
-    
-    except requests.exceptions.RequestException:
+    started = time.perf_counter()
+
+    # Запросы к Сервису 2 и Сервису 3 выполняются одновременно
+    calls = {
+        'abc': (executor.submit(call_service, SERVICE2_URL, input_string, SERVICE2_TIMEOUT), SERVICE2_TIMEOUT),
+        'chars': (executor.submit(call_service, SERVICE3_URL, input_string, SERVICE3_TIMEOUT), SERVICE3_TIMEOUT),
+    }
+    wait([future for future, _ in calls.values()], timeout=max(SERVICE2_TIMEOUT, SERVICE3_TIMEOUT))
+
+    counts = {}
+    timings = []
+    for name, (future, timeout) in calls.items():
+        if future.done():
+            counts[name], duration = future.result()
+        else:
+            counts[name], duration = None, timeout * 1000
+        timings.append(f"{name};dur={duration:.1f}")
+    timings.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+    headers = {'Server-Timing': ", ".join(timings)}
+
+    failed = [name for name, count in counts.items() if count is None]
+    if len(failed) == len(counts):
         return jsonify({
             'error': 'Service unavailable',
             'status': 'error'
-        }), 503
+        }), 503, headers
+
+    # Если один из сервисов не ответил, возвращается частичный результат
+    response = {
+        'abc_count': counts['abc'],
+        'char_count': counts['chars'],
+        'status': 'partial' if failed else 'success'
+    }
+    if failed:
+        response['unavailable'] = failed
+    return jsonify(response), 200, headers
 
 if __name__ == '__main__':
-    app.run(port=5000)
\ No newline at end of file
+    app.run(port=5000)
@@ -1,7 +1,14 @@
+import codecs
 from flask import Flask, request, jsonify
+from pattern_counter import PatternCounter
 
 app = Flask(__name__)
 
+# Размер части тела запроса, читаемой за один раз
+CHUNK_SIZE = 64 * 1024
+# Ограничение числа шаблонов в одном запросе
+MAX_PATTERNS = 1000
+
 @app.route('/count_abc', methods=['POST'])
 def count_abc():
     data = request.json
@@ -9,5 +16,38 @@ def count_abc():
     count = input_string.count('abc')
     return jsonify({'count': count, 'status': 'success'})
 
+# Потоковый подсчет: текст передается телом запроса как есть (можно chunked),
+# шаблоны - параметрами ?pattern=abc&pattern=xyz (по умолчанию "abc").
+# Тело читается частями, поэтому расход памяти не зависит от размера текста.
+@app.route('/count_abc/stream', methods=['POST'])
+def count_abc_stream():
+    patterns = request.args.getlist('pattern') or ['abc']
+    if len(patterns) > MAX_PATTERNS:
+        return jsonify({'error': f'Too many patterns, maximum is {MAX_PATTERNS}', 'status': 'error'}), 400
+    try:
+        counter = PatternCounter(patterns)
+    except ValueError:
+        return jsonify({'error': 'Patterns must be non-empty', 'status': 'error'}), 400
+
+    try:
+        decoder = codecs.getincrementaldecoder(request.mimetype_params.get('charset', 'utf-8'))(errors='replace')
+    except LookupError:
+        return jsonify({'error': 'Unknown charset', 'status': 'error'}), 400
+
+    size = 0
+    while True:
+        chunk = request.stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        counter.feed(decoder.decode(chunk))
+    counter.feed(decoder.decode(b'', final=True))
+
+    counts = counter.result()
+    response = {'counts': counts, 'bytes': size, 'status': 'success'}
+    if len(counts) == 1:
+        response['count'] = next(iter(counts.values()))
+    return jsonify(response)
+
 if __name__ == '__main__':
-    app.run(port=5001)
\ No newline at end of file
+    app.run(port=5001)
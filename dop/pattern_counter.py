@@ -0,0 +1,87 @@
+from collections import deque
+
+# Наибольшее число шаблонов, для которых используется подсчет через str.count
+FAST_PATH_MAX_PATTERNS = 8
+
+
+# Проверка, может ли шаблон перекрываться сам с собой (есть собственная грань, как у "aa" или "abab")
+def has_self_overlap(pattern):
+    return any(pattern[:k] == pattern[-k:] for k in range(1, len(pattern)))
+
+
+# Подсчет вхождений нескольких шаблонов в текст, поступающий частями.
+# Вхождения, разорванные границей частей, учитываются, перекрывающиеся вхождения
+# считаются все (для "abc" результат совпадает с str.count).
+# Память не зависит от длины текста: между частями хранится только состояние автомата
+# или короткие "хвосты" предыдущей части.
+class PatternCounter:
+    def __init__(self, patterns):
+        patterns = list(dict.fromkeys(patterns))
+        if not patterns or any(not pattern for pattern in patterns):
+            raise ValueError("Шаблоны должны быть непустыми строками")
+
+        self.patterns = patterns
+        self.counts = [0] * len(patterns)
+        # Небольшое число шаблонов без самоперекрытий быстрее считать через str.count,
+        # иначе используется автомат Ахо - Корасик, проходящий текст один раз
+        self.fast_path = (len(patterns) <= FAST_PATH_MAX_PATTERNS
+                          and not any(has_self_overlap(pattern) for pattern in patterns))
+        if self.fast_path:
+            self._tails = [''] * len(patterns)
+        else:
+            self._build_automaton()
+            self._node = 0
+
+    def _build_automaton(self):
+        goto = [{}]
+        output = [[]]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                if ch not in goto[node]:
+                    goto.append({})
+                    output.append([])
+                    goto[node][ch] = len(goto) - 1
+                node = goto[node][ch]
+            output[node].append(index)
+
+        # Суффиксные ссылки строятся обходом в ширину
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(ch, 0)
+                if fail[child] == child:
+                    fail[child] = 0
+                output[child] = output[child] + output[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(indexes) for indexes in output]
+
+    # Обработка очередной части текста
+    def feed(self, text):
+        if self.fast_path:
+            for i, pattern in enumerate(self.patterns):
+                buffer = self._tails[i] + text
+                self.counts[i] += buffer.count(pattern)
+                self._tails[i] = buffer[max(len(buffer) - len(pattern) + 1, 0):]
+            return
+
+        goto, fail, output, counts = self._goto, self._fail, self._output, self.counts
+        node = self._node
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in output[node]:
+                counts[index] += 1
+        self._node = node
+
+    def result(self):
+        return dict(zip(self.patterns, self.counts))
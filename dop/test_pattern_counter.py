@@ -0,0 +1,79 @@
+import random
+
+import pytest
+from pattern_counter import PatternCounter, FAST_PATH_MAX_PATTERNS, has_self_overlap
+
+
+# Число вхождений с перекрытиями, подсчитанное перебором
+def count_overlapping(text, pattern):
+    return sum(text.startswith(pattern, i) for i in range(len(text)))
+
+
+def count_in_chunks(patterns, chunks):
+    counter = PatternCounter(patterns)
+    for chunk in chunks:
+        counter.feed(chunk)
+    return counter, counter.result()
+
+
+# Тест подсчета в одной части: совпадает с str.count
+def test_single_chunk():
+    counter, result = count_in_chunks(["abc"], ["abcabcxyzabc"])
+    assert counter.fast_path
+    assert result == {"abc": "abcabcxyzabc".count("abc")}
+
+# Тест вхождения, разорванного границей частей
+def test_match_split_across_chunks():
+    assert count_in_chunks(["abc"], ["xa", "b", "cx"])[1] == {"abc": 1}
+    assert count_in_chunks(["abc"], ["ab", "cab", "c"])[1] == {"abc": 2}
+
+# Тест подачи текста по одному символу
+def test_one_char_chunks():
+    text = "abcxabcabx" * 20
+    assert count_in_chunks(["abc", "xa"], list(text))[1] == {"abc": text.count("abc"), "xa": text.count("xa")}
+
+# Тест частей, которые короче хвоста шаблона: вхождение внутри хвоста не считается дважды
+def test_short_chunks_do_not_double_count():
+    assert count_in_chunks(["abcd"], ["a", "b", "", "c", "d", "a", "bcd"])[1] == {"abcd": 2}
+
+# Тест самоперекрывающихся шаблонов: считаются все перекрывающиеся вхождения
+def test_overlapping_patterns():
+    counter, result = count_in_chunks(["aa", "abab"], ["aaa", "a", "bab", "ab"])
+    assert not counter.fast_path
+    text = "aaaababab"
+    assert result == {"aa": count_overlapping(text, "aa"), "abab": count_overlapping(text, "abab")}
+
+# Тест шаблонов, являющихся префиксами и суффиксами друг друга
+def test_nested_patterns():
+    text = "abababa"
+    patterns = ["a", "ab", "bab", "aba"]
+    result = count_in_chunks(patterns * 3, ["aba", "b", "aba"])[1]
+    assert result == {pattern: count_overlapping(text, pattern) for pattern in patterns}
+
+# Тест большого числа шаблонов (автомат) против перебора при случайном разбиении текста
+def test_many_patterns_random_chunks():
+    rng = random.Random(1)
+    patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4)))
+                for _ in range(FAST_PATH_MAX_PATTERNS * 2)]
+    patterns = list(dict.fromkeys(patterns))
+    for _ in range(20):
+        text = "".join(rng.choice("abc") for _ in range(300))
+        cuts = sorted(rng.sample(range(1, len(text)), 10))
+        chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        counter, result = count_in_chunks(patterns, chunks)
+        assert not counter.fast_path
+        assert result == {pattern: count_overlapping(text, pattern) for pattern in patterns}
+
+# Тест проверки самоперекрытия шаблона
+def test_has_self_overlap():
+    assert has_self_overlap("aa")
+    assert has_self_overlap("abab")
+    assert not has_self_overlap("abc")
+    assert not has_self_overlap("a")
+
+# Тест на пустые шаблоны
+def test_empty_patterns():
+    with pytest.raises(ValueError):
+        PatternCounter([])
+    with pytest.raises(ValueError):
+        PatternCounter(["abc", ""])
@@ -1,4 +1,5 @@
 from flask import Flask, request, jsonify
+import os
 import random
 
 app = Flask(__name__)
@@ -75,4 +76,5 @@ def delete_number():
     })
     
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Режим отладки только по FLASK_DEBUG=1: отладчик werkzeug позволяет выполнять код на сервере
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1')
\ No newline at end of file
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+# Личная книга пользователя, который еще ничего не сохранял
+EMPTY_BOOK = {}
+
+
+# Хранилище курсов валют: чтение из словарей в памяти, запись с отложенным сбросом на диск.
+# Есть общая книга курсов по умолчанию и личные книги пользователей, в которых лежат
+# только курсы, сохраненные самим пользователем, поверх общей книги. Пользователь,
+# ничего не сохранявший, не занимает памяти. Книги не изменяются на месте: запись
+# создает новый словарь (копирование при записи), поэтому снимок состояния - это
+# неглубокая копия, а по тождеству книги можно проверять актуальность кэшей.
+#
+# Курсы по умолчанию из настроек (defaults) в файлы не сохраняются и применяются поверх
+# сохраненной общей книги при каждом запуске, поэтому их изменение вступает в силу после перезапуска.
+#
+# Изменения копятся в буфере и раз в flush_interval секунд дописываются в журнал (JSON-строки).
+# Когда в журнале набирается snapshot_every записей, состояние целиком сохраняется
+# в снимок, а журнал очищается. При запуске читается снимок и поверх него журнал.
+class CurrencyStore:
+    def __init__(self, directory, defaults=None, flush_interval=1.0, snapshot_every=10000):
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.log_path = os.path.join(directory, 'currencies.log')
+        self.snapshot_path = os.path.join(directory, 'currencies.snapshot.json')
+        os.makedirs(directory, exist_ok=True)
+
+        self._initial_defaults = dict(defaults or {})
+        # Общая книга в том виде, в каком она сохраняется на диск (без курсов из настроек)
+        self._saved_defaults = {}
+        self._defaults = {}
+        self._books = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        # Запись на диск выполняется одним потоком за раз
+        self._write_lock = threading.Lock()
+        self._log_records = 0
+        self._task = None
+        self.load()
+
+    # Восстановление состояния: снимок, затем записи журнала по порядку.
+    # Недописанная последняя строка журнала (сбой во время записи) отбрасывается.
+    def load(self):
+        defaults = {}
+        books = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            defaults.update(snapshot['default'])
+            books = {int(user_id): book for user_id, book in snapshot['users'].items()}
+
+        records = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb+') as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Обрезаем хвост, чтобы следующая запись начиналась с новой строки
+                        logging.warning("Отброшена недописанная запись журнала курсов: %r", line)
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.warning("Пропущена поврежденная запись журнала курсов: %r", line)
+                        continue
+                    user_id = record.get('user')
+                    book = defaults if user_id is None else books.setdefault(user_id, {})
+                    book[record['currency']] = record['rate']
+                    records += 1
+
+        with self._lock:
+            self._saved_defaults = defaults
+            self._defaults = {**defaults, **self._initial_defaults}
+            self._books = books
+            self._log_records = records
+
+    # Книги пользователя: общая и личная (пустой словарь, если личных курсов нет).
+    # Возвращаемые словари не изменяются и могут использоваться как ключи актуальности кэша
+    def books(self, user_id):
+        return self._defaults, self._books.get(user_id, EMPTY_BOOK)
+
+    def get(self, user_id, currency, default=None):
+        defaults, book = self.books(user_id)
+        return book.get(currency, defaults.get(currency, default))
+
+    def has_rates(self, user_id):
+        defaults, book = self.books(user_id)
+        return bool(defaults or book)
+
+    # Курсы, видимые пользователю: общие, перекрытые личными
+    def items(self, user_id):
+        defaults, book = self.books(user_id)
+        return list({**defaults, **book}.items())
+
+    # Сохранение курса в личную книгу пользователя (user_id=None - в общую книгу)
+    def set(self, user_id, currency, rate):
+        with self._lock:
+            if user_id is None:
+                self._saved_defaults = {**self._saved_defaults, currency: rate}
+                self._defaults = {**self._defaults, currency: rate}
+            else:
+                self._books[user_id] = {**self._books.get(user_id, EMPTY_BOOK), currency: rate}
+            record = {'currency': currency, 'rate': rate}
+            if user_id is not None:
+                record['user'] = user_id
+            self._pending.append(record)
+
+    # Сброс накопленных изменений в журнал; при необходимости - новый снимок
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in pending)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._log_records += len(pending)
+            if self._log_records >= self.snapshot_every:
+                self._write_snapshot()
+
+    # Снимок записывается во временный файл и атомарно подменяет старый;
+    # журнал очищается только после этого, поэтому сбой в любой момент не теряет данных
+    def _write_snapshot(self):
+        with self._lock:
+            # Книги не изменяются на месте, поэтому достаточно копии словаря книг
+            defaults, books = self._saved_defaults, dict(self._books)
+            # Изменения из буфера попадут и в снимок, и в журнал - повторное применение безопасно
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'default': defaults, 'users': books}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        open(self.log_path, 'w').close()
+        self._log_records = 0
+
+    # Фоновый сброс не должен останавливаться из-за ошибки: она записывается в лог,
+    # а следующая попытка выполняется через flush_interval секунд
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logging.exception("Не удалось сохранить курсы на диск")
+
+    # Запуск фонового сброса (вызывается при старте диспетчера)
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    # Остановка фонового сброса и запись оставшихся изменений
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
@@ -6,23 +6,54 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from dotenv import load_dotenv 
+from currency_store import CurrencyStore
+from common.ttl_cache import TTLCache, MISSING
+from common.fsm_storage import create_storage
+from common.webhook import run_webhook
+from common.log_setup import setup_logging
+from common.metrics import setup_metrics
 
 load_dotenv() 
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s', 
-                    filename='bot.log', filemode='a', encoding='utf-8')
+setup_logging('bot.log')
 
 # Получение токена из переменных окружения
 bot_token = os.getenv('API_TOKEN')
+# Адрес для режима webhook; если не задан, бот получает обновления опросом (polling)
+webhook_url = os.getenv('WEBHOOK_URL')
 
 # Инициализация бота и диспетчера
 bot = Bot(token=bot_token)
-dp = Dispatcher()
-
-# Словарь для хранения валют и их курсов
-currencies = {}
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp)
+
+# Общие курсы по умолчанию из переменной окружения: CURRENCY_DEFAULTS=USD=90.5,EUR=98
+def parse_default_rates(value):
+    rates = {}
+    for item in value.split(','):
+        currency, _, rate = item.partition('=')
+        if currency.strip() and rate.strip():
+            rates[currency.strip().upper()] = float(rate)
+    return rates
+
+# Хранилище валют и их курсов: общая книга и личные книги пользователей.
+# Читается из памяти, изменения сбрасываются на диск в фоне
+currencies = CurrencyStore(
+    os.getenv('CURRENCY_STORE_DIR', 'currency_data'),
+    defaults=parse_default_rates(os.getenv('CURRENCY_DEFAULTS', '')),
+    flush_interval=float(os.getenv('CURRENCY_FLUSH_INTERVAL', '1')),
+    snapshot_every=int(os.getenv('CURRENCY_SNAPSHOT_EVERY', '10000'))
+)
+dp.startup.register(currencies.start)
+dp.shutdown.register(currencies.close)
+
+# Готовые тексты списка валют по пользователям; запись действительна,
+# пока книги пользователя те же объекты (любое изменение создает новую книгу)
+list_cache = TTLCache(
+    max_size=int(os.getenv('LIST_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('LIST_CACHE_TTL', '3600'))
+)
 
 # Состояния FSM
 class CurrencyStates(StatesGroup):
@@ -34,7 +65,7 @@ class CurrencyStates(StatesGroup):
 # Обработчик команды /start
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
-    logging.info(f"Команда /start от пользователя {message.from_user.id}")
+    logging.info("Команда /start от пользователя %s", message.from_user.id)
     await message.answer(
         "Привет! Я бот для конвертации валют.\n"
         "Доступные команды:\n"
@@ -46,7 +77,7 @@ async def start_command(message: types.Message):
 # Обработчик команды /save_currency
 @dp.message(Command("save_currency"))
 async def save_currency_command(message: types.Message, state: FSMContext):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /save_currency")
+    logging.info("Пользователь %s вызвал команду /save_currency", message.from_user.id)
     await message.answer("Введите название валюты (например, USD, EUR):")
     await state.set_state(CurrencyStates.waiting_for_currency_name)
 
@@ -55,7 +86,7 @@ async def save_currency_command(message: types.Message, state: FSMContext):
 async def process_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     await state.update_data(currency_name=currency_name)
-    logging.info(f"Пользователь {message.from_user.id} ввел название валюты: {currency_name}")
+    logging.info("Пользователь %s ввел название валюты: %s", message.from_user.id, currency_name)
     await message.answer(f"Введите курс {currency_name} к рублю (например, 90.5):")
     await state.set_state(CurrencyStates.waiting_for_currency_rate)
 
@@ -70,20 +101,20 @@ async def process_currency_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
         
-        # Сохраняем валюту в словарь
-        currencies[currency_name] = rate
-        logging.info(f"Курс {currency_name} сохранен: {rate} руб. от пользователя {message.from_user.id}.")
+        # Сохраняем валюту в личную книгу пользователя
+        currencies.set(message.from_user.id, currency_name, rate)
+        logging.info("Курс %s сохранен: %s руб. от пользователя %s.", currency_name, rate, message.from_user.id)
         await message.answer(f"Курс {currency_name} сохранен: {rate} руб.")
         await state.clear()
     except ValueError:
-        logging.error(f"Ошибка ввода курса от пользователя {message.from_user.id}: {message.text}")
+        logging.error("Ошибка ввода курса от пользователя %s: %s", message.from_user.id, message.text)
         await message.answer("Пожалуйста, введите корректное число для курса (например, 90.5)")
 
 # Обработчик команды /convert
 @dp.message(Command("convert"))
 async def convert_command(message: types.Message, state: FSMContext):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /convert")
-    if not currencies:
+    logging.info("Пользователь %s вызвал команду /convert", message.from_user.id)
+    if not currencies.has_rates(message.from_user.id):
         await message.answer("Нет сохраненных валют. Сначала используйте /save_currency")
         return
     
@@ -94,8 +125,8 @@ async def convert_command(message: types.Message, state: FSMContext):
 @dp.message(CurrencyStates.waiting_for_currency_to_convert)
 async def process_currency_to_convert(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
-    if currency_name not in currencies:
-        logging.warning(f"Пользователь {message.from_user.id} ввел некорректную валюту: {currency_name}")
+    if currencies.get(message.from_user.id, currency_name) is None:
+        logging.warning("Пользователь %s ввел некорректную валюту: %s", message.from_user.id, currency_name)
         await message.answer(f"Валюта {currency_name} не найдена. Введите другую валюту.")
         return
     
@@ -113,36 +144,50 @@ async def process_amount(message: types.Message, state: FSMContext):
         
         data = await state.get_data()
         currency_name = data['currency_name']
-        rate = currencies[currency_name]
+        rate = currencies.get(message.from_user.id, currency_name)
         
         result = amount * rate
-        logging.info(f"Конвертация: {amount} {currency_name} = {result:.2f} руб. от пользователя {message.from_user.id}.")
+        logging.info("Конвертация: %s %s = %.2f руб. от пользователя %s.", amount, currency_name, result, message.from_user.id)
         await message.answer(
             f"{amount} {currency_name} = {result:.2f} руб.\n"
             f"Курс: 1 {currency_name} = {rate} руб."
         )
         await state.clear()
     except ValueError:
-        logging.error(f"Ошибка ввода суммы от пользователя {message.from_user.id}: {message.text}")
+        logging.error("Ошибка ввода суммы от пользователя %s: %s", message.from_user.id, message.text)
         await message.answer("Пожалуйста, введите корректное число для суммы")
 
+# Текст списка валют пользователя, из кэша, если книги не менялись.
+# Пользователи без личных курсов видят общий список и делят одну запись кэша
+def render_currency_list(user_id):
+    books = currencies.books(user_id)
+    key = user_id if books[1] else None
+    cached = list_cache.get(key)
+    if cached is not MISSING and cached[0] is books[0] and cached[1] is books[1]:
+        return cached[2]
+
+    rates = {**books[0], **books[1]}
+    if rates:
+        lines = ["Сохраненные валюты и их курсы:"]
+        lines.extend(f"- {currency}: {rate} руб." for currency, rate in sorted(rates.items()))
+        text = "\n".join(lines)
+    else:
+        text = "Нет сохраненных валют."
+    list_cache.set(key, (books[0], books[1], text))
+    return text
+
 # Обработчик команды /list_currencies
 @dp.message(Command("list_currencies"))
 async def list_currencies_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /list_currencies")
-    if not currencies:
-        await message.answer("Нет сохраненных валют.")
-        return
-    
-    response = "Сохраненные валюты и их курсы:\n"
-    for currency, rate in currencies.items():
-        response += f"- {currency}: {rate} руб.\n"
-    
-    await message.answer(response)
+    logging.info("Пользователь %s вызвал команду /list_currencies", message.from_user.id)
+    await message.answer(render_currency_list(message.from_user.id))
 
 # Запуск бота
 async def main():
-    await dp.start_polling(bot)
+    if webhook_url:
+        await run_webhook(dp, bot, webhook_url)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+
+from currency_store import CurrencyStore
+
+
+def write_log(store, lines):
+    with open(store.log_path, 'w', encoding='utf-8') as f:
+        f.write(lines)
+
+
+def read_snapshot(store):
+    with open(store.snapshot_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Тест личных книг поверх общей
+def test_user_books_over_defaults(tmp_path):
+    store = CurrencyStore(tmp_path, defaults={'USD': 90.0, 'EUR': 98.0})
+    store.set(1, 'USD', 91.0)
+    assert store.get(1, 'USD') == 91.0
+    assert store.get(2, 'USD') == 90.0
+    assert store.get(1, 'EUR') == 98.0
+    assert sorted(store.items(1)) == [('EUR', 98.0), ('USD', 91.0)]
+
+# Тест восстановления из журнала после сброса
+def test_log_replay(tmp_path):
+    store = CurrencyStore(tmp_path)
+    store.set(1, 'USD', 91.0)
+    store.set(None, 'EUR', 98.0)
+    store.set(1, 'USD', 92.0)
+    store.flush()
+
+    restored = CurrencyStore(tmp_path)
+    assert restored.get(1, 'USD') == 92.0
+    assert restored.get(2, 'EUR') == 98.0
+
+# Тест недописанной последней строки журнала: она отбрасывается и обрезается,
+# чтобы следующая запись начиналась с новой строки
+def test_torn_last_line(tmp_path):
+    store = CurrencyStore(tmp_path)
+    write_log(store, '{"currency": "USD", "rate": 90.0}\n{"currency": "EUR", "ra')
+
+    restored = CurrencyStore(tmp_path)
+    assert restored.get(1, 'USD') == 90.0
+    assert restored.get(1, 'EUR') is None
+    restored.set(None, 'GBP', 110.0)
+    restored.flush()
+
+    again = CurrencyStore(tmp_path)
+    assert again.get(1, 'GBP') == 110.0
+    with open(store.log_path, encoding='utf-8') as f:
+        assert all(json.loads(line) for line in f)
+
+# Тест поврежденной строки в середине журнала: пропускается, остальные применяются
+def test_corrupt_line_skipped(tmp_path):
+    store = CurrencyStore(tmp_path)
+    write_log(store, '{"currency": "USD", "rate": 90.0}\nnot json\n{"currency": "EUR", "rate": 98.0}\n')
+    restored = CurrencyStore(tmp_path)
+    assert restored.get(1, 'USD') == 90.0
+    assert restored.get(1, 'EUR') == 98.0
+
+# Тест снимка: после snapshot_every записей состояние переносится в снимок, журнал очищается
+def test_snapshot_compacts_log(tmp_path):
+    store = CurrencyStore(tmp_path, snapshot_every=3)
+    store.set(1, 'USD', 91.0)
+    store.set(2, 'USD', 92.0)
+    store.flush()
+    assert not os.path.exists(store.snapshot_path)
+
+    store.set(None, 'EUR', 98.0)
+    store.flush()
+    assert os.path.getsize(store.log_path) == 0
+    assert read_snapshot(store) == {'default': {'EUR': 98.0}, 'users': {'1': {'USD': 91.0}, '2': {'USD': 92.0}}}
+
+    store.set(1, 'USD', 93.0)
+    store.flush()
+    restored = CurrencyStore(tmp_path)
+    assert restored.get(1, 'USD') == 93.0
+    assert restored.get(2, 'USD') == 92.0
+    assert restored.get(3, 'EUR') == 98.0
+
+# Тест курсов по умолчанию из настроек: не попадают в снимок и применяются при каждом запуске
+def test_configured_defaults_not_persisted(tmp_path):
+    store = CurrencyStore(tmp_path, defaults={'USD': 90.0}, snapshot_every=1)
+    store.set(1, 'EUR', 98.0)
+    store.flush()
+    assert read_snapshot(store)['default'] == {}
+
+    restored = CurrencyStore(tmp_path, defaults={'USD': 95.0})
+    assert restored.get(1, 'USD') == 95.0
+
+# Тест копирования при записи: изменение создает новую книгу, старая не меняется
+def test_copy_on_write(tmp_path):
+    store = CurrencyStore(tmp_path, defaults={'USD': 90.0})
+    defaults, book = store.books(1)
+    store.set(1, 'USD', 91.0)
+    new_defaults, new_book = store.books(1)
+    assert new_defaults is defaults
+    assert new_book is not book
+    assert book == {}
+
+# Тест фонового сброса: ошибка сброса записывается в лог и не останавливает задачу
+def test_periodic_flush_survives_errors(tmp_path, monkeypatch):
+    store = CurrencyStore(tmp_path, flush_interval=0.01)
+    calls = []
+
+    def flush():
+        calls.append(1)
+        if len(calls) == 1:
+            raise TypeError("сбой сериализации")
+
+    monkeypatch.setattr(store, 'flush', flush)
+
+    async def run():
+        await store.start()
+        await asyncio.sleep(0.1)
+        assert not store._task.done()
+        store._task.cancel()
+
+    asyncio.run(run())
+    assert len(calls) > 1
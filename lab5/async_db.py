@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from common.metrics import track_call
+
+
+# Асинхронный доступ к базе данных для обработчиков бота.
+# Синхронные запросы psycopg2 выполняются в отдельном пуле потоков,
+# поэтому медленный запрос не блокирует цикл событий aiogram.
+# Каждый поток берет соединение из общего пула, размер пула потоков
+# совпадает с максимальным числом соединений.
+class AsyncDB:
+    def __init__(self, min_size=1, max_size=10, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='db')
+
+    # Пул соединений создается при первом запросе, а не при импорте модуля
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.connect_kwargs)
+        return self._pool
+
+    # Соединение из пула на время блока with (вызывать только из потоков пула)
+    @contextmanager
+    def connection(self):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        finally:
+            if not conn.closed:
+                try:
+                    # Незавершенная транзакция не должна попасть к следующему запросу
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            pool.putconn(conn, close=broken or conn.closed != 0)
+
+    # Выполнение синхронной функции в пуле потоков без блокировки цикла событий
+    # Время вызова (включая ожидание свободного потока) попадает в метрики под именем функции
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with track_call('db', func.__name__):
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    # Закрытие пула потоков и всех соединений
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+# Параметры подключения из переменных окружения
+def create_db():
+    return AsyncDB(
+        min_size=int(os.getenv('DB_POOL_MIN', '1')),
+        max_size=int(os.getenv('DB_POOL_MAX', '10')),
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'currency_bot'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', 'postgres')
+    )
@@ -7,28 +7,43 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from dotenv import load_dotenv
+from async_db import create_db
+
+from common.ttl_cache import TTLCache, MISSING
+from common.fsm_storage import create_storage
+from common.webhook import run_webhook
+from common.log_setup import setup_logging
+from common.metrics import setup_metrics, register_cache
+from common.rendered_list import RenderedList, split_message
+from common.currency_schema import SCHEMA_SQL, LOAD_SQL
 
 load_dotenv()
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='bot.log',
-    filemode='a',
-    encoding='utf-8'
-)
+setup_logging('bot.log')
 
 # Получение токена из переменных окружения
 bot_token = os.getenv('API_TOKEN')
-db_host = os.getenv('DB_HOST', 'localhost')
-db_name = os.getenv('DB_NAME', 'currency_bot')
-db_user = os.getenv('DB_USER', 'postgres')
-db_password = os.getenv('DB_PASSWORD', 'postgres')
+# Адрес для режима webhook; если не задан, бот получает обновления опросом (polling)
+webhook_url = os.getenv('WEBHOOK_URL')
 
 # Инициализация бота и диспетчера
 bot = Bot(token=bot_token)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp)
+
+# Пул соединений с базой данных; запросы выполняются вне цикла событий через db.run
+db = create_db()
+
+# Кэш проверок прав администратора: состав админов меняется редко.
+# Попадания и промахи публикуются в /metrics (bot_cache_*{cache="admin"})
+admin_cache = register_cache('admin', TTLCache(
+    max_size=int(os.getenv('ADMIN_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('ADMIN_CACHE_TTL', '60'))
+))
+
+# Готовые сообщения /get_currencies для текущей версии таблицы currencies
+currency_list = RenderedList(ttl=float(os.getenv('LIST_CACHE_TTL', '5')))
 
 # Состояния FSM
 class CurrencyStates(StatesGroup):
@@ -44,187 +59,156 @@ class CurrencyStates(StatesGroup):
 def create_tables():
     #Создание таблиц в базе данных
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        # Создание таблицы currencies
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS currencies (
-                id SERIAL PRIMARY KEY,
-                currency_name VARCHAR(10) UNIQUE NOT NULL,
-                rate NUMERIC(10, 2) NOT NULL
-            )
-        """)
+            # Таблица currencies, номер ее версии и триггер - та же схема, что у сервисов lab6
+            cur.execute(SCHEMA_SQL)
         
-        # Создание таблицы admins
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS admins (
-                id SERIAL PRIMARY KEY,
-                chat_id VARCHAR(20) UNIQUE NOT NULL
-            )
-        """)
+            # Создание таблицы admins
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS admins (
+                    id SERIAL PRIMARY KEY,
+                    chat_id VARCHAR(20) UNIQUE NOT NULL
+                )
+            """)
         
-        conn.commit()
-        logging.info("Таблицы успешно созданы")
+            conn.commit()
+            logging.info("Таблицы успешно созданы")
     except Exception as e:
-        logging.error(f"Ошибка при создании таблиц: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logging.error("Ошибка при создании таблиц: %s", e)
 
-# Проверка, является ли пользователь администратором
-def is_admin(chat_id):
+# Проверка по базе данных, является ли пользователь администратором (None при ошибке)
+def query_is_admin(chat_id):
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute("SELECT 1 FROM admins WHERE chat_id = %s", (chat_id,))
-        return bool(cur.fetchone())
+            cur.execute("SELECT 1 FROM admins WHERE chat_id = %s", (chat_id,))
+            return bool(cur.fetchone())
     except Exception as e:
-        logging.error(f"Ошибка при проверке администратора: {e}")
+        logging.error("Ошибка при проверке администратора: %s", e)
+        return None
+
+# Проверка, является ли пользователь администратором, с кэшированием результата.
+# Ошибки базы данных не кэшируются, чтобы сбой не лишил админа доступа на весь TTL.
+async def is_admin(chat_id):
+    chat_id = str(chat_id)
+    cached = admin_cache.get(chat_id)
+    if cached is not MISSING:
+        return cached
+
+    result = await db.run(query_is_admin, chat_id)
+    if result is None:
         return False
-    finally:
-        if conn:
-            conn.close()
+    admin_cache.set(chat_id, result)
+    return result
 
 # Добавление новой валюты
 def add_currency(currency_name, rate):
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute(
-            "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
-            (currency_name.upper(), rate)
-        )
-        conn.commit()
-        return True
+            cur.execute(
+                "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
+                (currency_name.upper(), rate)
+            )
+            conn.commit()
+            return True
     except psycopg2.IntegrityError:
-        logging.warning(f"Валюта {currency_name} уже существует")
+        logging.warning("Валюта %s уже существует", currency_name)
         return False
     except Exception as e:
-        logging.error(f"Ошибка при добавлении валюты: {e}")
+        logging.error("Ошибка при добавлении валюты: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 # Удаление валюты
 def delete_currency(currency_name):
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute(
-            "DELETE FROM currencies WHERE currency_name = %s",
-            (currency_name.upper(),)
-        )
-        conn.commit()
-        return cur.rowcount > 0
+            cur.execute(
+                "DELETE FROM currencies WHERE currency_name = %s",
+                (currency_name.upper(),)
+            )
+            conn.commit()
+            return cur.rowcount > 0
     except Exception as e:
-        logging.error(f"Ошибка при удалении валюты: {e}")
+        logging.error("Ошибка при удалении валюты: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 #Обновление курса валюты
 def update_currency_rate(currency_name, new_rate):
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute(
-            "UPDATE currencies SET rate = %s WHERE currency_name = %s",
-            (new_rate, currency_name.upper())
-        )
-        conn.commit()
-        return cur.rowcount > 0
+            cur.execute(
+                "UPDATE currencies SET rate = %s WHERE currency_name = %s",
+                (new_rate, currency_name.upper())
+            )
+            conn.commit()
+            return cur.rowcount > 0
     except Exception as e:
-        logging.error(f"Ошибка при обновлении курса: {e}")
+        logging.error("Ошибка при обновлении курса: %s", e)
         return False
-    finally:
-        if conn:
-            conn.close()
 
-# Получение списка всех валют
+# Текущий номер версии таблицы currencies (None при ошибке)
+def get_currencies_version():
+    try:
+        with db.connection() as conn:
+            cur = conn.cursor()
+        
+            cur.execute("SELECT version FROM currencies_version WHERE id = 1")
+            result = cur.fetchone()
+            return result[0] if result else None
+    except Exception as e:
+        logging.error("Ошибка при получении версии списка валют: %s", e)
+        return None
+
+# Получение списка всех валют вместе с версией таблицы одним запросом (None при ошибке)
 def get_all_currencies():
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute("SELECT currency_name, rate FROM currencies ORDER BY currency_name")
-        return cur.fetchall()
+            cur.execute(LOAD_SQL)
+            rows = cur.fetchall()
+            if not rows:
+                return None
+            return rows[0][0], [(name, rate) for _, _, name, rate in rows if name is not None]
     except Exception as e:
-        logging.error(f"Ошибка при получении списка валют: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
+        logging.error("Ошибка при получении списка валют: %s", e)
+        return None
 
 # Получение курса валюты
 def get_currency_rate(currency_name):
     try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
-        cur = conn.cursor()
+        with db.connection() as conn:
+            cur = conn.cursor()
         
-        cur.execute(
-            "SELECT rate FROM currencies WHERE currency_name = %s",
-            (currency_name.upper(),)
-        )
-        result = cur.fetchone()
-        return result[0] if result else None
+            cur.execute(
+                "SELECT rate FROM currencies WHERE currency_name = %s",
+                (currency_name.upper(),)
+            )
+            result = cur.fetchone()
+            return result[0] if result else None
     except Exception as e:
-        logging.error(f"Ошибка при получении курса валюты: {e}")
+        logging.error("Ошибка при получении курса валюты: %s", e)
         return None
-    finally:
-        if conn:
-            conn.close()
 
 # Обработчики команд
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
-    logging.info(f"Команда /start от пользователя {message.from_user.id}")
+    logging.info("Команда /start от пользователя %s", message.from_user.id)
     
-    if is_admin(str(message.from_user.id)):
+    if await is_admin(message.from_user.id):
         commands = (
             "/start - Начало работы\n"
             "/manage_currency - Управление валютами (админ)\n"
+            "/refresh_admins - Сбросить кэш прав администраторов (админ)\n"
             "/get_currencies - Список валют\n"
             "/convert - Конвертировать валюту"
         )
@@ -242,9 +226,9 @@ async def start_command(message: types.Message):
 
 @dp.message(Command("manage_currency"))
 async def manage_currency_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /manage_currency")
+    logging.info("Пользователь %s вызвал команду /manage_currency", message.from_user.id)
     
-    if not is_admin(str(message.from_user.id)):
+    if not await is_admin(message.from_user.id):
         await message.answer("Нет доступа к команде")
         return
     
@@ -263,6 +247,19 @@ async def manage_currency_command(message: types.Message):
         reply_markup=keyboard
     )
 
+# Обработчик команды /refresh_admins: сброс кэша прав после изменения таблицы admins
+@dp.message(Command("refresh_admins"))
+async def refresh_admins_command(message: types.Message):
+    logging.info("Пользователь %s вызвал команду /refresh_admins", message.from_user.id)
+
+    if not await is_admin(message.from_user.id):
+        await message.answer("Нет доступа к команде")
+        return
+
+    admin_cache.clear()
+    logging.info("Кэш прав администраторов сброшен")
+    await message.answer("Кэш прав администраторов сброшен.")
+
 # Обработчик для нажатия кнопки "Добавить валюту"
 @dp.callback_query(F.data == "add_currency")
 async def add_currency_callback(callback: types.CallbackQuery, state: FSMContext):
@@ -289,7 +286,8 @@ async def process_currency_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
         
-        if add_currency(currency_name, rate):
+        if await db.run(add_currency, currency_name, rate):
+            currency_list.invalidate()
             await message.answer(f"Валюта: {currency_name} успешно добавлена")
         else:
             await message.answer(f"Валюта {currency_name} уже существует")
@@ -310,7 +308,8 @@ async def delete_currency_callback(callback: types.CallbackQuery, state: FSMCont
 async def process_currency_to_delete(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     
-    if delete_currency(currency_name):
+    if await db.run(delete_currency, currency_name):
+        currency_list.invalidate()
         await message.answer(f"Валюта {currency_name} успешно удалена")
     else:
         await message.answer(f"Валюта {currency_name} не найдена")
@@ -343,7 +342,8 @@ async def process_new_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
         
-        if update_currency_rate(currency_name, new_rate):
+        if await db.run(update_currency_rate, currency_name, new_rate):
+            currency_list.invalidate()
             await message.answer(f"Курс {currency_name} успешно обновлен: {new_rate} руб.")
         else:
             await message.answer(f"Валюта {currency_name} не найдена")
@@ -352,26 +352,39 @@ async def process_new_rate(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Пожалуйста, введите корректное число для курса (например, 90.5)")
 
+# Сообщения со списком валют. Пока версия таблицы не изменилась, используются
+# готовые тексты; версия сверяется с базой не чаще раза в LIST_CACHE_TTL секунд
+async def render_currency_list():
+    chunks = currency_list.fresh()
+    if chunks is None and currency_list.chunks is not None:
+        chunks = currency_list.confirm(await db.run(get_currencies_version))
+    if chunks is not None:
+        return chunks
+
+    result = await db.run(get_all_currencies)
+    if result is None:
+        return ["Ошибка при получении списка валют."]
+    version, currencies = result
+    if currencies:
+        lines = ["Список валют и их курсов к рублю:", ""]
+        lines.extend(f"- {currency}: {rate} руб." for currency, rate in currencies)
+        chunks = split_message(lines)
+    else:
+        chunks = ["Нет сохраненных валют."]
+    currency_list.set(version, chunks)
+    return chunks
+
 # Обработчик для команды /get_currencies
 @dp.message(Command("get_currencies"))
 async def get_currencies_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /get_currencies")
-    currencies = get_all_currencies()
-    
-    if not currencies:
-        await message.answer("Нет сохраненных валют.")
-        return
-    
-    response = "Список валют и их курсов к рублю:\n\n"
-    for currency, rate in currencies:
-        response += f"- {currency}: {rate} руб.\n"
-    
-    await message.answer(response)
+    logging.info("Пользователь %s вызвал команду /get_currencies", message.from_user.id)
+    for text in await render_currency_list():
+        await message.answer(text)
 
 # Обработчик для команды /convert
 @dp.message(Command("convert"))
 async def convert_command(message: types.Message, state: FSMContext):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /convert")
+    logging.info("Пользователь %s вызвал команду /convert", message.from_user.id)
     await message.answer("Введите название валюты для конвертации:")
     await state.set_state(CurrencyStates.waiting_for_currency_to_convert)
 
@@ -379,13 +392,14 @@ async def convert_command(message: types.Message, state: FSMContext):
 @dp.message(CurrencyStates.waiting_for_currency_to_convert)
 async def process_currency_to_convert(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
-    rate = get_currency_rate(currency_name)
+    rate = await db.run(get_currency_rate, currency_name)
     
     if rate is None:
         await message.answer(f"Валюта {currency_name} не найдена. Введите другую валюту.")
         return
     
-    await state.update_data(currency_name=currency_name, rate=rate)
+    # Курс сохраняется строкой: хранилище состояний сериализует данные в JSON
+    await state.update_data(currency_name=currency_name, rate=str(rate))
     await message.answer(f"Введите сумму в {currency_name} для конвертации в рубли:")
     await state.set_state(CurrencyStates.waiting_for_amount)
 
@@ -414,8 +428,14 @@ async def process_amount(message: types.Message, state: FSMContext):
 
 # Запуск бота
 async def main():
-    create_tables()  # Создаем таблицы при запуске бота
-    await dp.start_polling(bot)
+    await db.run(create_tables)  # Создаем таблицы при запуске бота
+    try:
+        if webhook_url:
+            await run_webhook(dp, bot, webhook_url)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+# Бот импортируется ради функций работы с базой данных; с Telegram тест не связывается,
+# поэтому токен и хранилище состояний подставляются, если не заданы
+os.environ.setdefault('API_TOKEN', '0:load-test')
+os.environ.setdefault('FSM_STORAGE', 'memory')
+from lab5_bot import db, get_all_currencies, get_currency_rate
+
+
+# Запрос обновления с номером i: чередуются /get_currencies и курс для /convert
+def query_for(i, currency):
+    if i % 2:
+        return get_currency_rate, (currency,)
+    return get_all_currencies, ()
+
+
+# Обработчик "до": функция бота вызывается прямо внутри корутины и блокирует цикл событий
+async def handler_blocking(i, currency):
+    func, args = query_for(i, currency)
+    func(*args)
+
+
+# Обработчик "после": та же функция выполняется в пуле потоков через db.run, как в боте
+async def handler_async(i, currency):
+    func, args = query_for(i, currency)
+    await db.run(func, *args)
+
+
+# Одновременная обработка updates обновлений, как это делает диспетчер aiogram
+async def measure(handler, updates, currency):
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(i, currency) for i in range(updates)))
+    elapsed = time.perf_counter() - started
+    return {
+        'updates': updates,
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(updates / elapsed, 1),
+    }
+
+
+# Проверка подключения: функции бота при ошибке базы возвращают пустой результат,
+# и без проверки тест измерил бы только обработку ошибок
+def check_database():
+    with db.connection() as conn:
+        conn.cursor().execute("SELECT 1")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков lab5_bot на реальной базе данных")
+    parser.add_argument('--updates', type=int, default=50, help="число одновременных обновлений")
+    parser.add_argument('--currency', default='USD', help="валюта для запросов курса")
+    args = parser.parse_args()
+
+    try:
+        try:
+            await db.run(check_database)
+        except psycopg2.Error as e:
+            print(f"PostgreSQL недоступен: {e}".strip(), file=sys.stderr)
+            sys.exit(1)
+
+        result = {
+            'before': await measure(handler_blocking, args.updates, args.currency.upper()),
+            'after': await measure(handler_async, args.updates, args.currency.upper()),
+        }
+    finally:
+        db.close()
+    result['speedup'] = round(result['after']['updates_per_second'] / result['before']['updates_per_second'], 1)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
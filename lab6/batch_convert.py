@@ -0,0 +1,37 @@
+import math
+import os
+
+# Пакетная конвертация, общая для data_manager.py и data_manager_async.py
+
+# Ограничение числа позиций в одном пакетном запросе
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100000'))
+# Число результатов, отправляемых клиенту одним фрагментом
+BATCH_CHUNK_SIZE = 1000
+
+# Разбор позиции пакета: {"currency_name": ..., "amount": ...} или пара [currency_name, amount]
+def parse_batch_item(item):
+    if isinstance(item, dict):
+        currency_name, amount = item.get('currency_name'), item.get('amount')
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        currency_name, amount = item
+    else:
+        raise ValueError
+    if not isinstance(currency_name, str) or isinstance(amount, bool):
+        raise ValueError
+    amount = float(amount)
+    if not math.isfinite(amount):
+        raise ValueError
+    return currency_name.upper(), amount
+
+# Пересчет одной позиции по снимку курсов
+def convert_batch_item(item, rates):
+    try:
+        currency_name, amount = parse_batch_item(item)
+    except (TypeError, ValueError):
+        return {"error": "Некорректная позиция"}
+
+    rate = rates.get(currency_name)
+    if rate is None:
+        return {"currency_name": currency_name, "amount": amount, "error": "Валюта не найдена"}
+    return {"currency_name": currency_name, "amount": amount,
+            "converted_amount": amount * rate, "rate": rate}
@@ -1,46 +1,37 @@
-import os
-import psycopg2
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-
-load_dotenv()
+import codecs
+import csv
+import io
+import math
+from flask import Flask, Response, request, jsonify
+from psycopg2.extras import execute_values
+from db_pool import pool
 
 app = Flask(__name__)
 
-# Конфигурация базы данных
-db_host = os.getenv('DB_HOST', 'localhost')
-db_name = os.getenv('DB_NAME', 'currency_bot')
-db_user = os.getenv('DB_USER', 'postgres')
-db_password = os.getenv('DB_PASSWORD', 'postgres')
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=db_host,
-        database=db_name,
-        user=db_user,
-        password=db_password
-    )
-
-# Маршрут для добавления валюты 
+# Ограничения столбцов таблицы currencies: VARCHAR(10) и NUMERIC(10, 2)
+MAX_NAME_LENGTH = 10
+MAX_RATE = 10 ** 8
+
+# Маршрут для добавления валюты
 @app.route('/load', methods=['POST'])
 def load_currency():
     data = request.json
     currency_name = data['currency_name'].upper()
     rate = data['rate']
 
-    conn = get_db_connection()
-    try:
+    with pool.connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,))
-        if cur.fetchone():
+        cur.execute(
+            "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s) "
+            "ON CONFLICT (currency_name) DO NOTHING RETURNING id",
+            (currency_name, rate)
+        )
+        if cur.fetchone() is None:
             return jsonify({"error": "Данная валюта уже существует"}), 400
-        
-        cur.execute("INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)", (currency_name, rate))
+
         conn.commit()
 
         return jsonify({"message": "Валюта успешно добавлена"}), 200
-    finally:
-        conn.close()
 
 # Маршрут для обновления курса валюты
 @app.route('/update_currency', methods=['POST'])
@@ -49,19 +40,15 @@ def update_currency():
     currency_name = data['currency_name'].upper()
     new_rate = data['new_rate']
 
-    conn = get_db_connection()
-    try:
+    with pool.connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,))
-        if not cur.fetchone():
-            return jsonify({"error": "Валюта не найдена"}), 404
-        
         cur.execute("UPDATE currencies SET rate = %s WHERE currency_name = %s", (new_rate, currency_name))
+        if cur.rowcount == 0:
+            return jsonify({"error": "Валюта не найдена"}), 404
+
         conn.commit()
 
         return jsonify({"message": "Курс успешно обновлен"}), 200
-    finally:
-        conn.close()
 
 # Маршрут для удаления валюты
 @app.route('/delete', methods=['POST'])
@@ -69,20 +56,145 @@ def delete_currency():
     data = request.json
     currency_name = data['currency_name'].upper()
 
-    conn = get_db_connection()
-    try:
+    with pool.connection() as conn:
         cur = conn.cursor()
-        
-        cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,))
-        if not cur.fetchone():
-            return jsonify({"error": "Валюта не найдена"}), 404
-        
         cur.execute("DELETE FROM currencies WHERE currency_name = %s", (currency_name,))
+        if cur.rowcount == 0:
+            return jsonify({"error": "Валюта не найдена"}), 404
+
         conn.commit()
 
         return jsonify({"message": "Валюта успешно удалена"}), 200
-    finally:
-        conn.close()
+
+# Построчное чтение загруженного файла: поток читается частями и декодируется
+# инкрементально, переводы строк \r\n и \r приводятся к \n. io.TextIOWrapper здесь не подходит:
+# в Python 3.9/3.10 SpooledTemporaryFile, в котором Flask хранит файл, не реализует readable()
+def iter_upload_lines(stream, encoding='utf-8-sig', chunk_size=64 * 1024):
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    tail = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        lines = (tail + decoder.decode(chunk, final=not chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if not chunk:
+            break
+    if tail:
+        yield tail
+
+# Чтение строк таблицы курсов из CSV: currency_name,rate (заголовок необязателен).
+# lines - итератор строк текста (файловый объект или iter_upload_lines)
+def read_csv_rows(lines):
+    lines = iter(lines)
+    sample = next(lines, '')
+    delimiter = ';' if sample.count(';') > sample.count(',') else ','
+    reader = csv.reader(io.StringIO(sample), delimiter=delimiter)
+    for row in reader:
+        if row and row[0].strip().lower() != 'currency_name':
+            yield row
+    for row in csv.reader(lines, delimiter=delimiter):
+        if row:
+            yield row
+
+# Получение строк таблицы курсов из запроса: JSON-массив, файл CSV или тело text/csv
+def read_bulk_rows():
+    upload = request.files.get('file')
+    if upload is not None:
+        return list(read_csv_rows(iter_upload_lines(upload.stream)))
+    if request.mimetype == 'text/csv':
+        return list(read_csv_rows(io.StringIO(request.get_data(as_text=True))))
+
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    return [
+        [item.get('currency_name'), item.get('rate')] if isinstance(item, dict) else item
+        for item in items
+    ]
+
+# Проверка строки таблицы курсов; возвращает (название, курс) или текст ошибки
+def validate_bulk_row(row):
+    if not isinstance(row, (list, tuple)) or len(row) != 2:
+        return None, "Ожидается пара currency_name, rate"
+    currency_name, rate = row
+    if not isinstance(currency_name, str) or not currency_name.strip():
+        return None, "Не указано название валюты"
+    currency_name = currency_name.strip().upper()
+    if len(currency_name) > MAX_NAME_LENGTH:
+        return None, f"Название валюты длиннее {MAX_NAME_LENGTH} символов"
+    try:
+        if isinstance(rate, bool):
+            raise ValueError
+        rate = float(rate.replace(',', '.')) if isinstance(rate, str) else float(rate)
+    except (TypeError, ValueError):
+        return None, "Курс должен быть числом"
+    if not math.isfinite(rate) or rate <= 0 or rate >= MAX_RATE:
+        return None, "Курс должен быть положительным числом"
+    return (currency_name, round(rate, 2)), None
+
+# Маршрут для загрузки всей таблицы курсов одним запросом.
+# Все строки записываются одним INSERT ... ON CONFLICT DO UPDATE в одной транзакции,
+# для каждой строки возвращается результат: inserted, updated, unchanged,
+# duplicate (валюта повторяется ниже в том же файле) или rejected.
+@app.route('/load/bulk', methods=['POST'])
+def load_currencies_bulk():
+    rows = read_bulk_rows()
+    if rows is None:
+        return jsonify({"error": "Ожидается JSON-массив или CSV-файл с курсами"}), 400
+
+    results = []
+    last_row_by_name = {}
+    for index, row in enumerate(rows, start=1):
+        values, error = validate_bulk_row(row)
+        if error:
+            results.append({"row": index, "status": "rejected", "error": error})
+            continue
+        results.append({"row": index, "currency_name": values[0], "rate": values[1]})
+        last_row_by_name[values[0]] = len(results) - 1
+
+    values = [(results[i]['currency_name'], results[i]['rate']) for i in last_row_by_name.values()]
+    changed = {}
+    if values:
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            returned = execute_values(
+                cur,
+                "INSERT INTO currencies (currency_name, rate) VALUES %s "
+                "ON CONFLICT (currency_name) DO UPDATE SET rate = EXCLUDED.rate "
+                "WHERE currencies.rate IS DISTINCT FROM EXCLUDED.rate "
+                "RETURNING currency_name, (xmax = 0) AS inserted",
+                values,
+                page_size=len(values),
+                fetch=True
+            )
+            conn.commit()
+        changed = dict(returned)
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicate": 0, "rejected": 0}
+    for i, result in enumerate(results):
+        if 'status' not in result:
+            name = result['currency_name']
+            if last_row_by_name[name] != i:
+                result['status'] = "duplicate"
+            elif name not in changed:
+                result['status'] = "unchanged"
+            else:
+                result['status'] = "inserted" if changed[name] else "updated"
+        counts[result['status']] += 1
+
+    return jsonify({**counts, "results": results}), 200
+
+# Маршрут для получения счетчиков пула соединений
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(pool.render_metrics(), mimetype='text/plain')
+
+# Прогрев пула соединений перед приемом запросов
+def startup():
+    pool.fill()
 
 if __name__ == '__main__':
+    startup()
     app.run(port=5001)
@@ -1,60 +1,73 @@
-import os
-import psycopg2
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-
-load_dotenv()
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
+from db_pool import pool
+from rate_cache import rate_cache
+from batch_convert import BATCH_MAX_ITEMS, BATCH_CHUNK_SIZE, convert_batch_item
 
 app = Flask(__name__)
 
-# Конфигурация базы данных
-db_host = os.getenv('DB_HOST', 'localhost')
-db_name = os.getenv('DB_NAME', 'currency_bot')
-db_user = os.getenv('DB_USER', 'postgres')
-db_password = os.getenv('DB_PASSWORD', 'postgres')
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=db_host,
-        database=db_name,
-        user=db_user,
-        password=db_password
-    )
-
-# Маршрут для конвертации валюты
+# Маршрут для конвертации валюты (курс берется из кэша в памяти)
 @app.route('/convert', methods=['GET'])
 def convert_currency():
     currency_name = request.args.get('currency_name').upper()
     amount = float(request.args.get('amount'))
 
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT rate FROM currencies WHERE currency_name = %s", (currency_name,))
-        result = cur.fetchone()
-        
-        if result is None:
-            return jsonify({"error": "Валюта не найдена"}), 404
-        
-        rate = float(result[0])
-        converted_amount = amount * rate
-
-        return jsonify({"converted_amount": converted_amount, "rate": float(rate)}), 200
-    finally:
-        conn.close()
-
-# Маршрут для получения списка всех валют
+    snapshot = rate_cache.snapshot()
+    rate = snapshot.rates.get(currency_name)
+
+    if rate is None:
+        return jsonify({"error": "Валюта не найдена"}), 404, {'X-Rates-Version': snapshot.version}
+
+    converted_amount = amount * rate
+
+    return jsonify({"converted_amount": converted_amount, "rate": rate}), 200, {'X-Rates-Version': snapshot.version}
+
+# Маршрут для пакетной конвертации: все позиции пересчитываются по одному снимку курсов,
+# ответ отправляется клиенту по частям, не собираясь целиком в памяти
+@app.route('/convert/batch', methods=['POST'])
+def convert_batch():
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({"error": "Ожидается список позиций items"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Слишком много позиций, максимум {BATCH_MAX_ITEMS}"}), 413
+
+    snapshot = rate_cache.snapshot()
+    rates = snapshot.rates
+
+    def generate():
+        yield f'{{"version": {snapshot.version}, "count": {len(items)}, "results": ['
+        for start in range(0, len(items), BATCH_CHUNK_SIZE):
+            chunk = items[start:start + BATCH_CHUNK_SIZE]
+            body = ", ".join(json.dumps(convert_batch_item(item, rates), ensure_ascii=False) for item in chunk)
+            yield (", " if start else "") + body
+        yield "]}"
+
+    return Response(stream_with_context(generate()), mimetype='application/json',
+                    headers={'X-Rates-Version': snapshot.version})
+
+# Маршрут для получения списка всех валют.
+# Тело ответа сериализуется один раз на версию таблицы; клиент с актуальной версией
+# (If-None-Match или If-Modified-Since) получает 304 без тела
 @app.route('/currencies', methods=['GET'])
 def get_currencies():
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT currency_name, rate FROM currencies")
-        currencies = cur.fetchall()
-        
-        return jsonify(currencies), 200
-    finally:
-        conn.close()
+    snapshot = rate_cache.snapshot()
+    response = Response(snapshot.body, mimetype='application/json', headers={'X-Rates-Version': snapshot.version})
+    response.set_etag(snapshot.etag)
+    response.last_modified = snapshot.changed_at
+    return response.make_conditional(request)
+
+# Маршрут для получения счетчиков пула соединений
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(pool.render_metrics(), mimetype='text/plain')
+
+# Прогрев пула соединений и запуск слушателя изменений курсов
+def startup():
+    pool.fill()
+    rate_cache.start()
 
 if __name__ == '__main__':
+    startup()
     app.run(port=5002)
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import asyncpg
+from aiohttp import web
+
+from db_pool import db_host, db_name, db_user, db_password
+from common.currency_schema import CHANNEL, SCHEMA_SQL, LOAD_SQL, RateSnapshot
+from batch_convert import BATCH_MAX_ITEMS, BATCH_CHUNK_SIZE, convert_batch_item
+
+# Асинхронный вариант API чтения курсов (те же URL и формат ответов, что у data_manager.py)
+# на aiohttp и asyncpg: один процесс держит тысячи одновременных запросов,
+# а курсы отдаются из снимка в памяти без обращения к базе данных.
+
+POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+POLL_INTERVAL = float(os.getenv('RATE_CACHE_POLL_INTERVAL', '30'))
+RECONNECT_DELAY = 1.0
+
+
+# Кэш курсов на цикле событий: слушает канал currencies_changed через отдельное
+# соединение asyncpg и раз в poll_interval секунд сверяет номер версии.
+# Пока слушатель не подключен, снимок перечитывается на каждый запрос.
+class AsyncRateCache:
+    def __init__(self, poll_interval=30.0):
+        self.poll_interval = poll_interval
+        self.pool = None
+        self._snapshot = None
+        self._listening = False
+        self._reload_lock = asyncio.Lock()
+        # Момент начала последнего чтения таблицы под блокировкой
+        self._load_started = 0.0
+        self._task = None
+        # Ссылки на запущенные по уведомлениям обновления, чтобы задачи не удалил сборщик мусора
+        self._reloads = set()
+
+    async def _load(self, conn):
+        result = await conn.fetch(LOAD_SQL)
+        version, changed_at = result[0]['version'], result[0]['changed_at']
+        rows = [(row['currency_name'], row['rate']) for row in result if row['currency_name'] is not None]
+        return RateSnapshot(version, rows, changed_at)
+
+    def _set_snapshot(self, snapshot):
+        previous = self._snapshot
+        if previous is not None and snapshot.version < previous.version:
+            return
+        self._snapshot = snapshot
+        if previous is None or previous.version != snapshot.version:
+            logging.info("Кэш курсов обновлен до версии %s: %s валют", snapshot.version, len(snapshot.rows))
+
+    # Перечитывание таблицы; одновременные запросы на обновление объединяются в одно чтение:
+    # если пока запрос ждал блокировку, началось и завершилось другое чтение, его снимок
+    # уже не старее момента запроса и используется повторно
+    async def _reload(self, version=None):
+        requested = time.monotonic()
+        async with self._reload_lock:
+            if self._snapshot is not None:
+                if version is not None and self._snapshot.version >= version:
+                    return self._snapshot
+                if version is None and self._load_started >= requested:
+                    return self._snapshot
+            self._load_started = time.monotonic()
+            async with self.pool.acquire() as conn:
+                self._set_snapshot(await self._load(conn))
+            return self._snapshot
+
+    async def start(self, pool):
+        self.pool = pool
+        async with pool.acquire() as conn:
+            await conn.execute(SCHEMA_SQL)
+        self._task = asyncio.create_task(self._listen_forever())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _listen_forever(self):
+        while True:
+            try:
+                await self._listen()
+            except Exception as e:
+                # Обрыв соединения asyncpg сообщает InterfaceError, а не PostgresError
+                logging.error("Слушатель изменений курсов отключен: %r", e)
+            finally:
+                self._listening = False
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _listen(self):
+        conn = await asyncpg.connect(host=db_host, database=db_name, user=db_user, password=db_password)
+        closed = asyncio.Event()
+        try:
+            def on_notify(connection, pid, channel, payload):
+                task = asyncio.get_running_loop().create_task(self._reload(int(payload)))
+                self._reloads.add(task)
+                task.add_done_callback(self._reloads.discard)
+
+            # При потере соединения запросы сразу переходят на чтение из базы
+            def on_terminate(connection):
+                self._listening = False
+                closed.set()
+
+            conn.add_termination_listener(on_terminate)
+            await conn.add_listener(CHANNEL, on_notify)
+            # Таблица читается после LISTEN, чтобы не пропустить изменения между ними
+            self._set_snapshot(await self._load(conn))
+            self._listening = True
+
+            while not conn.is_closed():
+                try:
+                    await asyncio.wait_for(closed.wait(), self.poll_interval)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                version = await conn.fetchval("SELECT version FROM currencies_version WHERE id = 1")
+                if version != self._snapshot.version:
+                    self._set_snapshot(await self._load(conn))
+        finally:
+            await conn.close()
+
+    # Текущий снимок курсов
+    async def snapshot(self):
+        if self._listening and self._snapshot is not None:
+            return self._snapshot
+        return await self._reload()
+
+
+rate_cache = AsyncRateCache(poll_interval=POLL_INTERVAL)
+
+
+def version_headers(snapshot):
+    return {'X-Rates-Version': str(snapshot.version)}
+
+
+# Маршрут для конвертации валюты (курс берется из кэша в памяти)
+async def convert_currency(request):
+    try:
+        currency_name = request.query['currency_name'].upper()
+        amount = float(request.query['amount'])
+    except (KeyError, ValueError):
+        return web.json_response({"error": "Укажите currency_name и числовой amount"}, status=400)
+
+    snapshot = await rate_cache.snapshot()
+    rate = snapshot.rates.get(currency_name)
+
+    if rate is None:
+        return web.json_response({"error": "Валюта не найдена"}, status=404, headers=version_headers(snapshot))
+
+    return web.json_response({"converted_amount": amount * rate, "rate": rate},
+                             headers=version_headers(snapshot))
+
+
+# Маршрут для пакетной конвертации: ответ отправляется клиенту по частям
+async def convert_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return web.json_response({"error": "Ожидается список позиций items"}, status=400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return web.json_response({"error": f"Слишком много позиций, максимум {BATCH_MAX_ITEMS}"}, status=413)
+
+    snapshot = await rate_cache.snapshot()
+    rates = snapshot.rates
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/json', **version_headers(snapshot)})
+    await response.prepare(request)
+    await response.write(f'{{"version": {snapshot.version}, "count": {len(items)}, "results": ['.encode())
+    for start in range(0, len(items), BATCH_CHUNK_SIZE):
+        chunk = items[start:start + BATCH_CHUNK_SIZE]
+        body = ", ".join(json.dumps(convert_batch_item(item, rates), ensure_ascii=False) for item in chunk)
+        await response.write(((", " if start else "") + body).encode())
+    await response.write(b"]}")
+    await response.write_eof()
+    return response
+
+
+# Клиент уже получил эту версию (If-None-Match или, без него, If-Modified-Since)
+def not_modified(request, snapshot):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or f'"{snapshot.etag}"' in tags
+    if_modified_since = request.if_modified_since
+    return if_modified_since is not None and snapshot.changed_at.replace(microsecond=0) <= if_modified_since
+
+
+# Маршрут для получения списка всех валют: [[название, курс строкой], ...] как у Flask-версии.
+# Тело ответа сериализуется один раз на версию, повторный запрос той же версии получает 304
+async def get_currencies(request):
+    snapshot = await rate_cache.snapshot()
+    headers = {
+        'ETag': f'"{snapshot.etag}"',
+        'Last-Modified': snapshot.changed_at.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+        **version_headers(snapshot),
+    }
+    if not_modified(request, snapshot):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=snapshot.body, content_type='application/json', headers=headers)
+
+
+# Маршрут для получения счетчиков пула соединений
+async def metrics(request):
+    pool = request.app['pool']
+    stats = {
+        'size': pool.get_size(),
+        'idle': pool.get_idle_size(),
+        'min_size': pool.get_min_size(),
+        'max_size': pool.get_max_size(),
+    }
+    text = "\n".join(f"db_pool_{key} {value}" for key, value in stats.items()) + "\n"
+    return web.Response(text=text, content_type='text/plain')
+
+
+async def on_startup(app):
+    app['pool'] = await asyncpg.create_pool(
+        host=db_host, database=db_name, user=db_user, password=db_password,
+        min_size=POOL_MIN, max_size=POOL_MAX
+    )
+    await rate_cache.start(app['pool'])
+
+
+async def on_cleanup(app):
+    await rate_cache.close()
+    await app['pool'].close()
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/convert', convert_currency)
+    app.router.add_post('/convert/batch', convert_batch)
+    app.router.add_get('/currencies', get_currencies)
+    app.router.add_get('/metrics', metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), port=5002)
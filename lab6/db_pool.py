@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Конфигурация базы данных
+db_host = os.getenv('DB_HOST', 'localhost')
+db_name = os.getenv('DB_NAME', 'currency_bot')
+db_user = os.getenv('DB_USER', 'postgres')
+db_password = os.getenv('DB_PASSWORD', 'postgres')
+
+
+# Исключение, если свободное соединение не удалось получить за отведенное время
+class PoolTimeout(Exception):
+    pass
+
+
+# Соединение из пула вместе с информацией для переиспользования
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.uses = 0
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+# Пул соединений с PostgreSQL, общий для всех сервисов lab6.
+# Ограничивает число соединений (min_size/max_size), проверяет соединение
+# при выдаче и пересоздает его после max_uses выдач или idle_timeout секунд простоя.
+# Проверка выполняется только для соединений, простоявших дольше health_check_after секунд,
+# чтобы горячие соединения не платили лишний запрос на каждую выдачу.
+class ConnectionPool:
+    def __init__(self, min_size=1, max_size=10, max_uses=1000, idle_timeout=300.0,
+                 checkout_timeout=5.0, health_check_after=5.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные размеры пула")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._in_use = 0
+        self._opened = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'health_check_failures': 0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self._count('connections_created')
+        return _PooledConnection(conn)
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    # После fork (например, в воркерах gunicorn) соединения родителя использовать нельзя
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _is_expired(self, item):
+        if self.max_uses and item.uses >= self.max_uses:
+            return True
+        if self.idle_timeout and time.monotonic() - item.released_at > self.idle_timeout:
+            return True
+        return False
+
+    def _is_alive(self, item):
+        if item.conn.closed:
+            return False
+        if time.monotonic() - item.released_at < self.health_check_after:
+            return True
+        try:
+            cur = item.conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            item.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, item):
+        try:
+            item.conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    # Заполнение пула до минимального размера (прогрев при запуске сервиса).
+    # Место в пуле занимается перед каждым подключением по одному, поэтому при ошибке
+    # освобождается ровно оно, а не все места, зарезервированные заранее
+    def fill(self):
+        while True:
+            with self._cond:
+                self._check_pid()
+                if self._opened >= self.min_size:
+                    return
+                self._opened += 1
+            try:
+                item = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(item)
+                self._cond.notify()
+
+    def _acquire(self):
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+
+        with self._cond:
+            self._check_pid()
+            while True:
+                if self._idle:
+                    item = self._idle.pop()
+                    break
+                if self._opened < self.max_size:
+                    self._opened += 1
+                    item = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout("Нет свободных соединений с базой данных")
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        try:
+            if item is None:
+                return self._connect()
+
+            if self._is_expired(item):
+                self._count('connections_recycled')
+                self._close_quietly(item)
+                return self._connect()
+
+            if not self._is_alive(item):
+                self._count('health_check_failures')
+                self._close_quietly(item)
+                return self._connect()
+
+            return item
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def _close_quietly(self, item):
+        try:
+            item.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _release(self, item, broken=False):
+        if self._pid != os.getpid():
+            return
+
+        if not broken and not item.conn.closed:
+            try:
+                # Незавершенная транзакция не должна попасть к следующему запросу
+                item.conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+
+        if broken or item.conn.closed:
+            self._discard(item)
+            return
+
+        item.uses += 1
+        item.released_at = time.monotonic()
+        with self._cond:
+            self._idle.append(item)
+            self._cond.notify()
+
+    # Выдача соединения из пула на время блока with
+    @contextmanager
+    def connection(self):
+        item = self._acquire()
+        broken = False
+        try:
+            yield item.conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._release(item, broken=broken)
+
+    # Закрытие всех свободных соединений
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for item in idle:
+            self._close_quietly(item)
+
+    # Счетчики занятости пула и времени ожидания
+    def stats(self):
+        with self._cond:
+            self._check_pid()
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'opened': self._opened,
+            })
+        return stats
+
+    # Счетчики в текстовом формате Prometheus
+    def render_metrics(self, prefix='db_pool'):
+        lines = []
+        for key, value in self.stats().items():
+            lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий пул для сервисов lab6, параметры задаются через переменные окружения
+pool = ConnectionPool(
+    min_size=int(os.getenv('DB_POOL_MIN', '1')),
+    max_size=int(os.getenv('DB_POOL_MAX', '10')),
+    max_uses=int(os.getenv('DB_POOL_MAX_USES', '1000')),
+    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+    checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    health_check_after=float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '5')),
+    host=db_host,
+    database=db_name,
+    user=db_user,
+    password=db_password
+)
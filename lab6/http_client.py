@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from common.metrics import track_call
+
+
+# Асинхронный HTTP-клиент для обращения бота к микросервисам.
+# Одна сессия aiohttp с пулом keep-alive соединений на все обработчики,
+# таймаут на каждый вызов и повторы с экспоненциальной задержкой.
+class ServiceClient:
+    def __init__(self, timeout=5.0, retries=2, backoff=0.2, limit=100, limit_per_host=20):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
+
+    # Сессия создается внутри работающего цикла событий при первом запросе
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    # Выполнение запроса; возвращает статус ответа и JSON-тело (None, если тело не JSON),
+    # а с with_headers=True - еще и заголовки ответа.
+    # name - шаблон маршрута для метрик (например, '/is_admin/{chat_id}'); путь из URL
+    # в метки не попадает, иначе каждый пользователь порождал бы новый ряд метрик.
+    # Повторяются ошибки соединения и таймауты, а для GET также ответы 5xx.
+    # POST повторяется только если соединение не удалось установить.
+    async def request(self, method, url, name=None, timeout=None, with_headers=False, **kwargs):
+        session = self._get_session()
+        call_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        idempotent = method == 'GET'
+
+        # Время запроса вместе с повторами попадает в метрики под методом и шаблоном маршрута,
+        # а без него - под адресом сервиса
+        with track_call('http', f"{method} {name or urlsplit(url).netloc}"):
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                try:
+                    async with session.request(method, url, timeout=call_timeout, **kwargs) as response:
+                        if response.status >= 500 and idempotent and not last_attempt:
+                            logging.warning("Сервис %s вернул %s, повтор запроса", url, response.status)
+                        else:
+                            try:
+                                data = await response.json(content_type=None)
+                            except ValueError:
+                                data = None
+                            if with_headers:
+                                return response.status, data, response.headers
+                            return response.status, data
+                except aiohttp.ClientConnectorError as e:
+                    if last_attempt:
+                        raise
+                    logging.warning("Не удалось подключиться к %s: %s, повтор запроса", url, e)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if last_attempt or not idempotent:
+                        raise
+                    logging.warning("Ошибка запроса к %s: %r, повтор запроса", url, e)
+
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Общий клиент для всех обработчиков бота, параметры задаются через переменные окружения
+services = ServiceClient(
+    timeout=float(os.getenv('SERVICE_TIMEOUT', '5')),
+    retries=int(os.getenv('SERVICE_RETRIES', '2')),
+    backoff=float(os.getenv('SERVICE_BACKOFF', '0.2'))
+)
@@ -1,26 +1,32 @@
 import asyncio
 import os
 import logging
+import aiohttp
 import psycopg2 
-import requests
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
+from http_client import services
+
+from common.ttl_cache import TTLCache, MISSING
+from common.fsm_storage import create_storage
+from common.webhook import run_webhook
+from common.log_setup import setup_logging
+from common.metrics import setup_metrics, register_cache
+from common.rendered_list import RenderedList, split_message
 
 load_dotenv()
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s', 
-                    filename='bot.log', 
-                    filemode='a', 
-                    encoding='utf-8')
+setup_logging('bot.log')
 
 # Получение токена из переменных окружения
 bot_token = os.getenv('API_TOKEN')
+# Адрес для режима webhook; если не задан, бот получает обновления опросом (polling)
+webhook_url = os.getenv('WEBHOOK_URL')
 db_host = os.getenv('DB_HOST', 'localhost')
 db_name = os.getenv('DB_NAME', 'currency_bot')
 db_user = os.getenv('DB_USER', 'postgres')
@@ -28,7 +34,21 @@ db_password = os.getenv('DB_PASSWORD', 'postgres')
 
 # Инициализация бота и диспетчера
 bot = Bot(token=bot_token)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp)
+
+# Кэш проверок прав администратора: состав админов меняется редко.
+# Попадания и промахи публикуются в /metrics (bot_cache_*{cache="admin"})
+admin_cache = register_cache('admin', TTLCache(
+    max_size=int(os.getenv('ADMIN_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('ADMIN_CACHE_TTL', '60'))
+))
+
+# Готовые сообщения /get_currencies для текущей версии курсов (ETag ответа /currencies)
+currency_list = RenderedList(ttl=float(os.getenv('LIST_CACHE_TTL', '5')))
+
+# Ошибки обращения к микросервисам (недоступен сервис или истек таймаут)
+SERVICE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
 
 # Состояния FSM
 class CurrencyStates(StatesGroup):
@@ -69,31 +89,46 @@ def create_tables():
         conn.commit()
         logging.info("Таблицы успешно созданы")
     except Exception as e:
-        logging.error(f"Ошибка при создании таблиц: {e}")
+        logging.error("Ошибка при создании таблиц: %s", e)
     finally:
         if conn:
             conn.close()
 
-# Проверка, является ли пользователь администратором
-async def is_admin(chat_id):
+# Запрос к сервису ролей, является ли пользователь администратором (None при ошибке)
+async def fetch_is_admin(chat_id):
     try:
-        response = requests.get(f'http://localhost:5003/is_admin/{chat_id}')
-        if response.status_code == 200:
-            return response.json().get('is_admin', False)
-        return False
+        status, data = await services.get(f'http://localhost:5003/is_admin/{chat_id}', name='/is_admin/{chat_id}')
+        if status == 200:
+            return bool(data.get('is_admin', False))
+        return None
     except Exception as e:
-        logging.error(f"Ошибка при проверке администратора: {e}")
+        logging.error("Ошибка при проверке администратора: %s", e)
+        return None
+
+# Проверка, является ли пользователь администратором, с кэшированием результата.
+# Ошибки сервиса ролей не кэшируются, чтобы сбой не лишил админа доступа на весь TTL.
+async def is_admin(chat_id):
+    chat_id = str(chat_id)
+    cached = admin_cache.get(chat_id)
+    if cached is not MISSING:
+        return cached
+
+    result = await fetch_is_admin(chat_id)
+    if result is None:
         return False
+    admin_cache.set(chat_id, result)
+    return result
 
 # Обработчики команд
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /start")
+    logging.info("Пользователь %s вызвал команду /start", message.from_user.id)
     
-    if await is_admin(str(message.from_user.id)):
+    if await is_admin(message.from_user.id):
         commands = (
             "/start - Начало работы\n"
             "/manage_currency - Управление валютами (админ)\n"
+            "/refresh_admins - Сбросить кэш прав администраторов (админ)\n"
             "/get_currencies - Список валют\n"
             "/convert - Конвертировать валюту"
         )
@@ -111,9 +146,9 @@ async def start_command(message: types.Message):
 
 @dp.message(Command("manage_currency"))
 async def manage_currency_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /manage_currency")
+    logging.info("Пользователь %s вызвал команду /manage_currency", message.from_user.id)
     
-    if not await is_admin(str(message.from_user.id)):
+    if not await is_admin(message.from_user.id):
         await message.answer("Нет доступа к команде")
         return
     
@@ -128,6 +163,19 @@ async def manage_currency_command(message: types.Message):
         reply_markup=keyboard
     )
 
+# Обработчик команды /refresh_admins: сброс кэша прав после изменения таблицы admins
+@dp.message(Command("refresh_admins"))
+async def refresh_admins_command(message: types.Message):
+    logging.info("Пользователь %s вызвал команду /refresh_admins", message.from_user.id)
+
+    if not await is_admin(message.from_user.id):
+        await message.answer("Нет доступа к команде")
+        return
+
+    admin_cache.clear()
+    logging.info("Кэш прав администраторов сброшен")
+    await message.answer("Кэш прав администраторов сброшен.")
+
 # Обработчик для нажатия кнопки "Добавить валюту"
 @dp.callback_query(F.data == "add_currency")
 async def add_currency_callback(callback: types.CallbackQuery, state: FSMContext):
@@ -158,20 +206,25 @@ async def process_currency_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
 
-        response = requests.post('http://localhost:5001/load', json={
+        status, result = await services.post('http://localhost:5001/load', name='/load', json={
             'currency_name': currency_name,
             'rate': rate
         })
 
-        if response.status_code == 200:
+        if status == 200:
+            currency_list.invalidate()
             await message.answer(f"Валюта {currency_name} успешно добавлена")
         else:
-            error = response.json().get('error', 'Неизвестная ошибка')
+            error = (result or {}).get('error', 'Неизвестная ошибка')
             await message.answer(f"Ошибка: {error}")
 
         await state.clear()
     except ValueError:
         await message.answer("Пожалуйста, введите корректное число для курса (например, 90.5)")
+    except SERVICE_ERRORS as e:
+        logging.error("Ошибка при добавлении валюты: %r", e)
+        await message.answer("Сервис управления валютами недоступен, попробуйте позже")
+        await state.clear()
 
 # Обработчик для нажатия кнопки "Удалить валюту"
 @dp.callback_query(F.data == "delete_currency")
@@ -189,15 +242,20 @@ async def delete_currency_callback(callback: types.CallbackQuery, state: FSMCont
 async def process_currency_to_delete(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     
-    response = requests.post('http://localhost:5001/delete', json={
-        'currency_name': currency_name
-    })
+    try:
+        status, result = await services.post('http://localhost:5001/delete', name='/delete', json={
+            'currency_name': currency_name
+        })
     
-    if response.status_code == 200:
-        await message.answer(f"Валюта {currency_name} успешно удалена")
-    else:
-        error = response.json().get('error', 'Неизвестная ошибка')
-        await message.answer(f"Ошибка: {error}")
+        if status == 200:
+            currency_list.invalidate()
+            await message.answer(f"Валюта {currency_name} успешно удалена")
+        else:
+            error = (result or {}).get('error', 'Неизвестная ошибка')
+            await message.answer(f"Ошибка: {error}")
+    except SERVICE_ERRORS as e:
+        logging.error("Ошибка при удалении валюты: %r", e)
+        await message.answer("Сервис управления валютами недоступен, попробуйте позже")
     
     await state.clear()
 
@@ -231,45 +289,77 @@ async def process_new_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
 
-        response = requests.post('http://localhost:5001/update_currency', json={
+        status, result = await services.post('http://localhost:5001/update_currency', name='/update_currency', json={
             'currency_name': currency_name,
             'new_rate': new_rate
         })
 
-        if response.status_code == 200:
+        if status == 200:
+            currency_list.invalidate()
             await message.answer(f"Курс {currency_name} успешно обновлен: {new_rate} руб.")
         else:
-            error = response.json().get('error', 'Неизвестная ошибка')
+            error = (result or {}).get('error', 'Неизвестная ошибка')
             await message.answer(f"Ошибка: {error}")
 
         await state.clear()
     except ValueError:
         await message.answer("Пожалуйста, введите корректное число для курса (например, 90.5)")
+    except SERVICE_ERRORS as e:
+        logging.error("Ошибка при обновлении курса: %r", e)
+        await message.answer("Сервис управления валютами недоступен, попробуйте позже")
+        await state.clear()
+
+# Сообщения со списком валют (None при ошибке сервиса). Пока версия курсов не изменилась,
+# используются готовые тексты; не чаще раза в LIST_CACHE_TTL секунд версия сверяется
+# условным запросом: если ETag совпал, сервис отвечает 304 без тела
+async def render_currency_list():
+    chunks = currency_list.fresh()
+    if chunks is not None:
+        return chunks
+
+    headers = {}
+    if currency_list.version is not None:
+        headers['If-None-Match'] = currency_list.version
+    status, currencies, response_headers = await services.get(
+        'http://localhost:5002/currencies', name='/currencies', headers=headers, with_headers=True
+    )
+    version = response_headers.get('ETag')
+    if status == 304:
+        return currency_list.confirm(version or currency_list.version)
+    if status != 200:
+        return None
+
+    if currencies:
+        lines = ["Список валют и их курсов к рублю:", ""]
+        lines.extend(f"- {currency[0]}: {currency[1]} руб." for currency in currencies)
+        chunks = split_message(lines)
+    else:
+        chunks = ["Нет сохраненных валют."]
+    currency_list.set(version, chunks)
+    return chunks
 
 # Обработчик для команды /get_currencies
 @dp.message(Command("get_currencies"))
 async def get_currencies_command(message: types.Message):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /get_currencies")
+    logging.info("Пользователь %s вызвал команду /get_currencies", message.from_user.id)
     
-    response = requests.get('http://localhost:5002/currencies')
-    if response.status_code == 200:
-        currencies = response.json()
-        if not currencies:
-            await message.answer("Нет сохраненных валют.")
-            return
-        
-        response_message = "Список валют и их курсов к рублю:\n\n"
-        for currency in currencies:
-            response_message += f"- {currency[0]}: {currency[1]} руб.\n"
-        
-        await message.answer(response_message)
-    else:
+    try:
+        chunks = await render_currency_list()
+    except SERVICE_ERRORS as e:
+        logging.error("Ошибка при получении списка валют: %r", e)
+        chunks = None
+
+    if chunks is None:
         await message.answer("Ошибка при получении списка валют.")
+        return
+
+    for text in chunks:
+        await message.answer(text)
 
 # Обработчик для команды /convert
 @dp.message(Command("convert"))
 async def convert_command(message: types.Message, state: FSMContext):
-    logging.info(f"Пользователь {message.from_user.id} вызвал команду /convert")
+    logging.info("Пользователь %s вызвал команду /convert", message.from_user.id)
     await message.answer("Введите название валюты для конвертации:")
     await state.set_state(CurrencyStates.waiting_for_currency_to_convert)
 
@@ -292,31 +382,39 @@ async def process_amount(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data['currency_name']
 
-        response = requests.get('http://localhost:5002/convert', params={
+        status, result = await services.get('http://localhost:5002/convert', name='/convert', params={
             'currency_name': currency_name,
             'amount': amount
         })
 
-        if response.status_code == 200:
-            result = response.json()
+        if status == 200:
             await message.answer(
                 f"{amount} {currency_name} = {result['converted_amount']:.2f} руб.\n"
                 f"Курс: 1 {currency_name} = {result['rate']} руб."
             )
         else:
-            error = response.json().get('error', 'Неизвестная ошибка')
+            error = (result or {}).get('error', 'Неизвестная ошибка')
             await message.answer(f"Ошибка: {error}")
 
         await state.clear()
     except ValueError:
         await message.answer("Пожалуйста, введите корректное число для суммы")
+    except SERVICE_ERRORS as e:
+        logging.error("Ошибка при конвертации: %r", e)
+        await message.answer("Сервис конвертации недоступен, попробуйте позже")
     finally:
         await state.clear()
 
 # Запуск бота
 async def main():
     create_tables() # Создаем таблицы при запуске бота
-    await dp.start_polling(bot)
+    try:
+        if webhook_url:
+            await run_webhook(dp, bot, webhook_url)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await services.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,118 @@
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+from db_pool import pool
+from common.currency_schema import CHANNEL, SCHEMA_SQL, LOAD_SQL, RateSnapshot
+
+# Кэш курсов валют в памяти сервиса.
+# Фоновый поток слушает канал currencies_changed и перечитывает таблицу после каждой записи,
+# а раз в poll_interval секунд сверяет номер версии на случай потерянного уведомления.
+# Пока слушатель не подключен, снимок перечитывается на каждый запрос, поэтому
+# устаревшие курсы не отдаются даже при потере соединения.
+# Слушатель запускается один раз в startup() сервиса; в процессе, созданном fork,
+# состояние сбрасывается обработчиком fork, поэтому запрос не берет блокировку и не сверяет pid.
+class RateCache:
+    def __init__(self, poll_interval=30.0, reconnect_delay=1.0):
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._snapshot = None
+        self._listening = False
+        self._lock = threading.Lock()
+        self._thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # Поток слушателя не переживает fork: в дочернем процессе его нужно запустить заново
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listening = False
+
+    @staticmethod
+    def _load(cur):
+        cur.execute(LOAD_SQL)
+        result = cur.fetchall()
+        version, changed_at = result[0][0], result[0][1]
+        rows = [(name, rate) for _, _, name, rate in result if name is not None]
+        return RateSnapshot(version, rows, changed_at)
+
+    def _set_snapshot(self, snapshot):
+        previous = self._snapshot
+        # Снимок, прочитанный параллельно в другом потоке, может оказаться старее текущего
+        if previous is not None and snapshot.version < previous.version:
+            return
+        self._snapshot = snapshot
+        if previous is None or previous.version != snapshot.version:
+            logging.info("Кэш курсов обновлен до версии %s: %s валют", snapshot.version, len(snapshot.rows))
+
+    def _load_from_pool(self):
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            snapshot = self._load(cur)
+        self._set_snapshot(snapshot)
+        return snapshot
+
+    # Запуск фонового слушателя (один раз на процесс, в том числе после fork)
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(SCHEMA_SQL)
+                conn.commit()
+
+            self._thread = threading.Thread(target=self._listen_forever, name='rate-cache', daemon=True)
+            self._thread.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError) as e:
+                logging.error("Слушатель изменений курсов отключен: %s", e)
+            self._listening = False
+            time.sleep(self.reconnect_delay)
+
+    def _listen(self):
+        conn = psycopg2.connect(**pool.connect_kwargs)
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL}")
+            # Таблица читается после LISTEN, чтобы не пропустить изменения между ними
+            self._set_snapshot(self._load(cur))
+            self._listening = True
+
+            while True:
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    cur.execute("SELECT version FROM currencies_version WHERE id = 1")
+                    if cur.fetchone()[0] != self._snapshot.version:
+                        self._set_snapshot(self._load(cur))
+                    continue
+
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    self._set_snapshot(self._load(cur))
+        finally:
+            conn.close()
+
+    # Текущий снимок курсов. Если startup() не вызывался, слушатель запускается при первом запросе
+    def snapshot(self):
+        if self._thread is None:
+            self.start()
+        if self._listening and self._snapshot is not None:
+            return self._snapshot
+        return self._load_from_pool()
+
+
+rate_cache = RateCache(
+    poll_interval=float(os.getenv('RATE_CACHE_POLL_INTERVAL', '30'))
+)
@@ -1,37 +1,26 @@
-import os
-import psycopg2
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-
-load_dotenv()
+from flask import Flask, Response, request, jsonify
+from db_pool import pool
 
 app = Flask(__name__)
 
-# Конфигурация базы данных
-db_host = os.getenv('DB_HOST', 'localhost')
-db_name = os.getenv('DB_NAME', 'currency_bot')
-db_user = os.getenv('DB_USER', 'postgres')
-db_password = os.getenv('DB_PASSWORD', 'postgres')
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=db_host,
-        database=db_name,
-        user=db_user,
-        password=db_password
-    )
-
 # Маршрут для проверки, является ли пользователь администратором
 @app.route('/is_admin/<chat_id>', methods=['GET'])
 def is_admin(chat_id):
-    conn = get_db_connection()
-    try:
+    with pool.connection() as conn:
         cur = conn.cursor()
         cur.execute("SELECT 1 FROM admins WHERE chat_id = %s", (chat_id,))
         is_admin = cur.fetchone() is not None
         return jsonify({"is_admin": is_admin}), 200
-    finally:
-        conn.close()
+
+# Маршрут для получения счетчиков пула соединений
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(pool.render_metrics(), mimetype='text/plain')
+
+# Открытие соединений пула при запуске сервиса
+def startup():
+    pool.fill()
 
 if __name__ == '__main__':
+    startup()
     app.run(port=5003)
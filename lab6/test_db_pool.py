@@ -0,0 +1,166 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+# Соединение без сервера: проверка SELECT 1 завершается ошибкой, если соединение "оборвано"
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.dead:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return opened
+
+
+def make_pool(**kwargs):
+    options = dict(min_size=0, max_size=2, checkout_timeout=0.2, health_check_after=0.0)
+    options.update(kwargs)
+    return ConnectionPool(**options)
+
+
+# Тест переиспользования: свободное соединение выдается повторно без нового подключения
+def test_connection_reused(connections):
+    pool = make_pool()
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(connections) == 1
+    assert pool.stats()['idle'] == 1
+
+# Тест ограничения max_size и тайм-аута выдачи: третий запрос ждет и получает PoolTimeout
+def test_max_size_and_checkout_timeout(connections):
+    pool = make_pool()
+    with pool.connection(), pool.connection():
+        started = time.monotonic()
+        with pytest.raises(PoolTimeout):
+            with pool.connection():
+                pass
+        assert time.monotonic() - started >= 0.2
+    stats = pool.stats()
+    assert len(connections) == 2
+    assert stats['opened'] == 2
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 0
+
+# Тест ожидания: возвращенное соединение достается ожидающему потоку
+def test_waiter_gets_released_connection(connections):
+    pool = make_pool(max_size=1, checkout_timeout=2.0)
+    got = []
+
+    def worker():
+        with pool.connection() as conn:
+            got.append(conn)
+
+    with pool.connection() as conn:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.1)
+    thread.join()
+    assert got == [conn]
+    assert pool.stats()['waits'] == 1
+
+# Тест пересоздания соединения после max_uses выдач
+def test_recycle_after_max_uses(connections):
+    pool = make_pool(max_uses=2)
+    for _ in range(3):
+        with pool.connection():
+            pass
+    assert len(connections) == 2
+    assert connections[0].closed
+    assert pool.stats()['connections_recycled'] == 1
+    assert pool.stats()['opened'] == 1
+
+# Тест пересоздания соединения после idle_timeout секунд простоя
+def test_recycle_after_idle_timeout(connections):
+    pool = make_pool(idle_timeout=0.05)
+    with pool.connection():
+        pass
+    time.sleep(0.1)
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    assert connections[0].closed
+    assert pool.stats()['connections_recycled'] == 1
+
+# Тест оборванного соединения: не проходит проверку при выдаче и заменяется новым
+def test_dead_idle_connection_replaced(connections):
+    pool = make_pool()
+    with pool.connection():
+        pass
+    connections[0].dead = True
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['opened'] == 1
+
+# Тест ошибки соединения внутри блока with: соединение закрывается, место в пуле освобождается
+def test_broken_connection_discarded(connections):
+    pool = make_pool()
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("server closed the connection")
+    assert connections[0].closed
+    stats = pool.stats()
+    assert stats['opened'] == 0
+    assert stats['idle'] == 0
+    assert stats['in_use'] == 0
+
+# Тест ошибки подключения: зарезервированное место освобождается при выдаче и при прогреве
+def test_failed_connect_releases_reservation(monkeypatch):
+    def connect(**kwargs):
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    pool = make_pool(min_size=1, max_size=1)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.fill()
+    for _ in range(2):
+        with pytest.raises(psycopg2.OperationalError):
+            with pool.connection():
+                pass
+    stats = pool.stats()
+    assert stats['opened'] == 0
+    assert stats['in_use'] == 0
+    assert stats['timeouts'] == 0
@@ -1,24 +1,243 @@
-from flask import Flask, request, jsonify
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import date, datetime
+
+import psycopg2
+from flask import Flask, Response, request, jsonify
+from dotenv import load_dotenv
+
+load_dotenv()
 
 app = Flask(__name__)
 
-# Статические курсы валют
+# Статические курсы валют: используются, пока для валюты нет истории в базе данных
 CURRENCY_RATES = {
     "USD": 75.50,
     "EUR": 80.20
 }
 
+# Наибольшее число дат в одном запросе /rates
+MAX_DATES = 1000
+# Интервал перечитывания истории курсов из базы данных (секунды)
+RELOAD_INTERVAL = float(os.getenv('RATES_RELOAD_INTERVAL', '300'))
+
+# Подключение к БД
+def get_db_connection():
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD')
+    )
+
+# Создание таблицы истории курсов. Процессы gunicorn запускаются одновременно,
+# поэтому DDL выполняется под advisory-блокировкой до конца транзакции
+def create_tables():
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('currency_rates_schema'))")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS currency_rates (
+                currency VARCHAR(10) NOT NULL,
+                date DATE NOT NULL,
+                rate NUMERIC(12, 4) NOT NULL,
+                PRIMARY KEY (currency, date)
+            )
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Индекс курсов в памяти: для каждой валюты отсортированные списки дат и курсов.
+# Курс на дату ищется двоичным поиском - действует последний курс, установленный не позже даты.
+# Для дат раньше начала истории используется самый ранний известный курс.
+class RateIndex:
+    def __init__(self, defaults):
+        self.defaults = defaults
+        self.version = 0
+        self.changed_at = time.time()
+        self._series = {}
+        # Готовые ответы /rate текущей версии: {валюта: (тело, ETag)}
+        self._responses = {}
+        self._lock = threading.Lock()
+        # Перечитывание истории выполняет один поток за раз
+        self._reload_lock = threading.Lock()
+        self._set_series({})
+        # История из базы данных загружается при первом запросе
+        self.loaded_at = 0.0
+
+    def _set_series(self, history):
+        series = {currency: ([date.min], [rate]) for currency, rate in self.defaults.items()}
+        for currency, points in history.items():
+            series[currency] = ([point[0] for point in points], [point[1] for point in points])
+        self._publish(series)
+        self.loaded_at = time.time()
+
+    # Замена индекса; время изменения и готовые ответы обновляются, только если курсы изменились
+    def _publish(self, series):
+        if series == self._series:
+            return
+        self._series = series
+        self._responses = {}
+        self.version += 1
+        self.changed_at = time.time()
+
+    # Загрузка всей истории из базы данных
+    def load(self):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT currency, date, rate FROM currency_rates ORDER BY currency, date")
+            history = {}
+            for currency, rate_date, rate in cur:
+                history.setdefault(currency, []).append((rate_date, float(rate)))
+        finally:
+            conn.close()
+        with self._lock:
+            self._set_series(history)
+
+    # Перечитывание истории, если она старше RELOAD_INTERVAL; ошибки БД не мешают отдавать курсы.
+    # Загружает один поток, остальные запросы не ждут его и отдают текущий индекс
+    def refresh(self):
+        if time.time() - self.loaded_at < RELOAD_INTERVAL:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if time.time() - self.loaded_at < RELOAD_INTERVAL:
+                return
+            try:
+                self.load()
+            except psycopg2.Error as e:
+                app.logger.error("Не удалось загрузить историю курсов: %s", e)
+                self.loaded_at = time.time()
+        finally:
+            self._reload_lock.release()
+
+    # Добавление курса на дату в базу данных и в индекс
+    def add(self, currency, rate_date, rate):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO currency_rates (currency, date, rate) VALUES (%s, %s, %s) "
+                "ON CONFLICT (currency, date) DO UPDATE SET rate = EXCLUDED.rate",
+                (currency, rate_date, rate)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            dates, rates = self._series.get(currency, ([], []))
+            # История валюты заменяет статический курс по умолчанию
+            if dates[:1] == [date.min]:
+                dates, rates = [], []
+            dates, rates = list(dates), list(rates)
+            position = bisect_right(dates, rate_date)
+            if position and dates[position - 1] == rate_date:
+                rates[position - 1] = rate
+            else:
+                insort(dates, rate_date)
+                rates.insert(position, rate)
+            series = dict(self._series)
+            series[currency] = (dates, rates)
+            self._publish(series)
+
+    def has_currency(self, currency):
+        return currency in self._series
+
+    def rate_on(self, currency, rate_date):
+        dates, rates = self._series[currency]
+        position = bisect_right(dates, rate_date)
+        return rates[max(position - 1, 0)]
+
+    def latest(self, currency):
+        return self._series[currency][1][-1]
+
+    # Сериализованный ответ /rate и его ETag; строятся один раз до следующего изменения курсов.
+    # ETag вычисляется по содержимому, поэтому совпадает во всех процессах сервиса
+    def rate_response(self, currency):
+        responses = self._responses
+        cached = responses.get(currency)
+        if cached is None:
+            body = json.dumps({"rate": self.latest(currency)}, separators=(",", ":")).encode()
+            cached = (body, hashlib.md5(body).hexdigest())
+            responses[currency] = cached
+        return cached
+
+
+rate_index = RateIndex(CURRENCY_RATES)
+
+@app.before_request
+def refresh_rates():
+    rate_index.refresh()
+
 @app.route('/rate', methods=['GET'])
 def get_rate():
     currency = request.args.get('currency', '').upper()
-    
-    if currency not in CURRENCY_RATES:
+
+    if not rate_index.has_currency(currency):
         return jsonify({"message": "UNKNOWN CURRENCY"}), 400
-    
+
+    # Клиент с актуальным ETag (If-None-Match) получает 304 без тела
     try:
-        return jsonify({"rate": CURRENCY_RATES[currency]}), 200
+        body, etag = rate_index.rate_response(currency)
     except Exception:
         return jsonify({"message": "UNEXPECTED ERROR"}), 500
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = rate_index.changed_at
+    return response.make_conditional(request)
+
+# Курсы валюты сразу на несколько дат: /rates?currency=USD&dates=2024-01-01,2024-02-01
+@app.route('/rates', methods=['GET'])
+def get_rates():
+    currency = request.args.get('currency', '').upper()
+    if not rate_index.has_currency(currency):
+        return jsonify({"message": "UNKNOWN CURRENCY"}), 400
+
+    try:
+        dates = {datetime.strptime(value, "%Y-%m-%d").date()
+                 for value in request.args.get('dates', '').split(',') if value}
+    except ValueError:
+        return jsonify({"message": "INVALID DATE"}), 400
+    if not dates or len(dates) > MAX_DATES:
+        return jsonify({"message": f"FROM 1 TO {MAX_DATES} DATES EXPECTED"}), 400
+
+    rates = {rate_date.isoformat(): rate_index.rate_on(currency, rate_date) for rate_date in sorted(dates)}
+    return jsonify({"currency": currency, "rates": rates}), 200
+
+# Добавление курса на дату: {"currency": "USD", "date": "2024-01-01", "rate": 90.5}
+@app.route('/rates', methods=['POST'])
+def add_rate():
+    data = request.get_json(silent=True) or {}
+    try:
+        currency = data['currency'].upper()
+        rate_date = datetime.strptime(data['date'], "%Y-%m-%d").date()
+        rate = float(data['rate'])
+        if not 0 < rate < 10 ** 8:
+            raise ValueError
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return jsonify({"message": "INVALID RATE"}), 400
+
+    rate_index.add(currency, rate_date, rate)
+    return jsonify({"currency": currency, "date": rate_date.isoformat(), "rate": rate}), 200
+
+# Создание таблицы и загрузка истории курсов; без базы данных сервис работает на статических курсах
+def startup():
+    try:
+        create_tables()
+        rate_index.load()
+    except psycopg2.Error as e:
+        app.logger.error("История курсов недоступна, используются статические курсы: %s", e)
 
 if __name__ == '__main__':
-    app.run(port=5003)
\ No newline at end of file
+    startup()
+    app.run(port=5003)
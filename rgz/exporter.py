@@ -0,0 +1,80 @@
+import csv
+import io
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# Число строк, получаемых с сервера за одно обращение к курсору
+FETCH_SIZE = 2000
+
+HEADER = ("Дата", "Сумма", "Валюта", "Тип")
+
+
+# Доступные форматы выгрузки (XLSX только при установленном openpyxl)
+def available_formats():
+    return ("csv", "xlsx") if Workbook is not None else ("csv",)
+
+
+# Порции строк операций пользователя из именованного (серверного) курсора:
+# в памяти одновременно находится не больше FETCH_SIZE строк.
+def iter_operation_chunks(conn, chat_id, date_from=None, date_to=None):
+    query = "SELECT date, sum, type_operation FROM operations WHERE chat_id = %s"
+    params = [chat_id]
+    if date_from is not None:
+        query += " AND date >= %s"
+        params.append(date_from)
+    if date_to is not None:
+        query += " AND date <= %s"
+        params.append(date_to)
+    query += " ORDER BY date, id"
+
+    cur = conn.cursor(name=f"export_{chat_id}")
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+# Строки выгрузки с суммой, пересчитанной по курсу на дату операции.
+# rate_lookup получает даты порции и возвращает словарь {дата: курс}
+def iter_converted(conn, chat_id, rate_lookup, date_from=None, date_to=None):
+    for rows in iter_operation_chunks(conn, chat_id, date_from, date_to):
+        rates = rate_lookup({row[0] for row in rows})
+        for op_date, amount, type_operation in rows:
+            yield op_date, round(float(amount) / rates[op_date], 2), type_operation
+
+
+# Запись выгрузки в двоичный файл file; возвращает число выгруженных операций
+def export_operations(conn, file, chat_id, rate_lookup, fmt="csv", currency="RUB", date_from=None, date_to=None):
+    rows = iter_converted(conn, chat_id, rate_lookup, date_from, date_to)
+    count = 0
+
+    if fmt == "xlsx":
+        if Workbook is None:
+            raise ValueError("Для выгрузки в XLSX требуется openpyxl")
+        # В режиме write_only строки сразу сбрасываются на диск, а не хранятся в памяти
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Операции")
+        sheet.append(HEADER)
+        for op_date, amount, type_operation in rows:
+            sheet.append((op_date, amount, currency, type_operation))
+            count += 1
+        workbook.save(file)
+        return count
+
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text, delimiter=";")
+    writer.writerow(HEADER)
+    for op_date, amount, type_operation in rows:
+        writer.writerow((op_date.isoformat(), amount, currency, type_operation))
+        count += 1
+    text.flush()
+    text.detach()
+    return count
@@ -0,0 +1,171 @@
+import csv
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+from summaries import INCOME, EXPENSE, record_operations
+
+# Ограничение столбца operations.sum: NUMERIC(10, 2)
+MAX_AMOUNT = Decimal(10) ** 8
+# Размер пакета строк, отправляемого в БД одним INSERT
+INSERT_PAGE_SIZE = 1000
+# Сколько отклоненных строк перечислять в отчете
+MAX_REPORTED_ERRORS = 20
+
+TYPE_ALIASES = {
+    'доход': INCOME, 'income': INCOME, 'credit': INCOME, '+': INCOME,
+    'расход': EXPENSE, 'expense': EXPENSE, 'debit': EXPENSE, '-': EXPENSE,
+}
+
+
+# Ошибка в строке импортируемого файла
+class RowError(Exception):
+    pass
+
+
+# Результат импорта: число добавленных операций и отклоненные строки
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line_no, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, reason))
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value.strip().replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise RowError(f"некорректная сумма {value!r}")
+    if not amount.is_finite() or amount == 0 or abs(amount) >= MAX_AMOUNT:
+        raise RowError(f"некорректная сумма {value!r}")
+    return amount
+
+
+def parse_date(value, formats=("%Y-%m-%d", "%d.%m.%Y")):
+    for date_format in formats:
+        try:
+            parsed = datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+        if parsed > date.today():
+            raise RowError(f"дата {value} в будущем")
+        return parsed
+    raise RowError(f"некорректная дата {value!r}")
+
+
+# Тип операции берется из столбца, а если его нет - по знаку суммы
+def make_operation(op_date, amount, type_value=None):
+    if type_value:
+        type_operation = TYPE_ALIASES.get(type_value.strip().lower())
+        if type_operation is None:
+            raise RowError(f"неизвестный тип операции {type_value!r}")
+    else:
+        type_operation = EXPENSE if amount < 0 else INCOME
+    return op_date, abs(amount).quantize(Decimal('0.01')), type_operation
+
+
+# Построчный разбор CSV: дата, сумма[, тип]. Заголовок необязателен, разделитель "," или ";".
+# Возвращает (номер строки, операция или ошибка)
+def parse_csv(text_stream):
+    first_line = text_stream.readline()
+    delimiter = ';' if first_line.count(';') >= first_line.count(',') and ';' in first_line else ','
+    lines = _chain([first_line], text_stream)
+    for line_no, row in enumerate(csv.reader(lines, delimiter=delimiter), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if line_no == 1 and row[0].strip().lower() in ('date', 'дата'):
+            continue
+        try:
+            if len(row) not in (2, 3):
+                raise RowError("ожидается дата, сумма и необязательный тип")
+            yield line_no, make_operation(parse_date(row[0]), parse_amount(row[1]),
+                                          row[2] if len(row) == 3 else None)
+        except RowError as e:
+            yield line_no, e
+
+
+def _chain(head, tail):
+    yield from head
+    yield from tail
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<]*)', re.IGNORECASE)
+
+
+# Потоковый разбор выписки OFX (SGML или XML): каждая транзакция STMTTRN
+# превращается в операцию по DTPOSTED и знаку TRNAMT. Номер строки - строка конца транзакции.
+def parse_ofx(text_stream):
+    transaction = None
+    for line_no, line in enumerate(text_stream, start=1):
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    transaction = {}
+                elif transaction is not None:
+                    yield line_no, _ofx_operation(transaction)
+                    transaction = None
+            elif transaction is not None and not closing and value.strip():
+                transaction[tag] = value.strip()
+
+
+def _ofx_operation(transaction):
+    try:
+        if 'DTPOSTED' not in transaction or 'TRNAMT' not in transaction:
+            raise RowError("в транзакции нет DTPOSTED или TRNAMT")
+        op_date = parse_date(transaction['DTPOSTED'][:8], formats=("%Y%m%d",))
+        return make_operation(op_date, parse_amount(transaction['TRNAMT']))
+    except RowError as e:
+        return e
+
+
+# Выбор разборщика по имени файла
+def parse_statement(filename, binary_stream):
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', errors='replace', newline='')
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        return parse_ofx(text_stream)
+    return parse_csv(text_stream)
+
+
+# Импорт операций пользователя из разобранного файла одной транзакцией.
+# Строки вставляются пакетами через execute_values, агрегаты обновляются в той же транзакции.
+def import_operations(conn, chat_id, parsed_rows):
+    report = ImportReport()
+    cur = conn.cursor()
+    batch = []
+    try:
+        for line_no, result in parsed_rows:
+            if isinstance(result, RowError):
+                report.reject(line_no, str(result))
+                continue
+            batch.append((chat_id, *result))
+            if len(batch) >= INSERT_PAGE_SIZE:
+                _insert_batch(cur, batch)
+                report.imported += len(batch)
+                batch = []
+        if batch:
+            _insert_batch(cur, batch)
+            report.imported += len(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+
+def _insert_batch(cur, batch):
+    execute_values(
+        cur,
+        "INSERT INTO operations (chat_id, date, sum, type_operation) VALUES %s",
+        batch,
+        page_size=INSERT_PAGE_SIZE
+    )
+    record_operations(cur, batch)
@@ -1,28 +1,54 @@
 import asyncio
 import os
 import logging
+import tempfile
 import psycopg2
 import requests
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.types import FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardMarkup, InlineKeyboardButton
-from datetime import datetime
+from datetime import date, datetime
 from dotenv import load_dotenv
+from summaries import create_summary_tables, record_operations, fetch_summary
+from importer import parse_statement, import_operations
+from exporter import available_formats, export_operations
+
+from common.ttl_cache import TTLCache, MISSING
+from common.fsm_storage import create_storage
+from common.webhook import run_webhook
+from common.log_setup import setup_logging
+from common.metrics import setup_metrics, track_call, timed
 
 load_dotenv()
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s', 
-                    filename='bot.log', 
-                    filemode='a', 
-                    encoding='utf-8')
+setup_logging('bot.log')
+
+# Адрес для режима webhook; если не задан, бот получает обновления опросом (polling)
+webhook_url = os.getenv('WEBHOOK_URL')
 
 # Инициализация бота
 bot = Bot(token=os.getenv('API_TOKEN'))
-dp = Dispatcher()
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp)
+
+# Кэш курсов валют по датам: исторические курсы почти не меняются, поэтому
+# просмотр операций запрашивает у сервиса только даты, которых еще нет в кэше
+rate_cache = TTLCache(max_size=10000, ttl=float(os.getenv('RATE_CACHE_TTL', '300')))
+# Наибольшее число дат в одном запросе к сервису курсов
+RATES_BATCH_SIZE = 1000
+# Таймаут запроса к сервису курсов, сек
+RATES_TIMEOUT = float(os.getenv('RATES_TIMEOUT', '10'))
+
+# Число операций на одной странице просмотра
+OPERATIONS_PAGE_SIZE = int(os.getenv('OPERATIONS_PAGE_SIZE', '20'))
+# Число месяцев в отчете /summary
+SUMMARY_MONTHS = int(os.getenv('SUMMARY_MONTHS', '12'))
+# Наибольший размер файла, который бот может скачать через Bot API
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
 
 # Состояния FSM
 class FinanceStates(StatesGroup):
@@ -32,6 +58,7 @@ class FinanceStates(StatesGroup):
     waiting_for_date = State()
     waiting_for_currency = State()
     waiting_for_sort_order = State()
+    waiting_for_import_file = State()
 
 # Подключение к БД
 def get_db_connection():
@@ -63,13 +90,69 @@ def create_tables():
                 type_operation VARCHAR(10) NOT NULL
             )
         """)
+        # Индекс для постраничного просмотра операций пользователя по дате
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS operations_chat_id_date_idx
+            ON operations (chat_id, date, id)
+        """)
+        create_summary_tables(cur)
         conn.commit()
     except Exception as e:
-        logging.error(f"Ошибка при создании таблиц: {e}")
+        logging.error("Ошибка при создании таблиц: %s", e)
     finally:
         conn.close()
 
+# Ошибка получения курсов; текст исключения показывается пользователю
+class RateServiceError(Exception):
+    pass
+
+# Курсы валюты на даты операций через сервис курсов с кэшированием.
+# Недостающие в кэше даты запрашиваются одним запросом /rates (по RATES_BATCH_SIZE дат).
+# Функция блокирующая: из обработчиков вызывается через asyncio.to_thread
+def fetch_rates(currency, dates):
+    if currency == "RUB":
+        return dict.fromkeys(dates, 1.0)
+
+    rates = {}
+    missing = []
+    for op_date in set(dates):
+        rate = rate_cache.get((currency, op_date))
+        if rate is MISSING:
+            missing.append(op_date)
+        else:
+            rates[op_date] = rate
+
+    missing.sort()
+    for start in range(0, len(missing), RATES_BATCH_SIZE):
+        chunk = missing[start:start + RATES_BATCH_SIZE]
+        try:
+            with track_call('http', 'GET /rates'):
+                response = requests.get("http://localhost:5003/rates", params={
+                    'currency': currency,
+                    'dates': ",".join(op_date.isoformat() for op_date in chunk)
+                }, timeout=RATES_TIMEOUT)
+        except requests.RequestException as e:
+            logging.error("Сервис курсов недоступен: %r", e)
+            raise RateServiceError("Сервис курсов недоступен. Попробуйте позже.")
+
+        # Проверка статуса ответа и обработка ошибок
+        if response.status_code == 500:
+            raise RateServiceError("Внутренняя ошибка сервиса. Попробуйте позже.")
+        if response.status_code != 200:
+            raise RateServiceError("Не удалось получить курс валюты")
+
+        for value, rate in response.json()['rates'].items():
+            op_date = date.fromisoformat(value)
+            rates[op_date] = rate
+            rate_cache.set((currency, op_date), rate)
+    return rates
+
+# Пересчет суммы в рублях в валюту по курсу на дату операции
+def convert_sum(amount, rate):
+    return round(float(amount) / rate, 2)
+
 # Проверка регистрации пользователя
+@timed('db')
 async def is_user_registered(chat_id):
     conn = get_db_connection()
     try:
@@ -87,7 +170,10 @@ async def start_command(message: types.Message):
         "Доступные команды:\n"
         "/reg - Регистрация\n"
         "/add_operation - Добавить операцию\n"
-        "/operations - Просмотр операций"
+        "/operations - Просмотр операций\n"
+        "/summary - Баланс и итоги по месяцам\n"
+        "/import - Загрузить операции из CSV или OFX\n"
+        "/export - Выгрузить операции в файл"
     )
 
 # Обработчик команды /reg
@@ -113,7 +199,7 @@ async def process_username(message: types.Message, state: FSMContext):
         conn.commit()
         await message.answer(f"Регистрация завершена, {message.text}!")
     except Exception as e:
-        logging.error(f"Ошибка при регистрации: {e}")
+        logging.error("Ошибка при регистрации: %s", e)
         await message.answer("Произошла ошибка при регистрации")
     finally:
         conn.close()
@@ -160,20 +246,23 @@ async def process_amount(message: types.Message, state: FSMContext):
 @dp.message(FinanceStates.waiting_for_date)
 async def process_date(message: types.Message, state: FSMContext):
     try:
-        datetime.strptime(message.text, "%Y-%m-%d")
+        op_date = datetime.strptime(message.text, "%Y-%m-%d").date()
         data = await state.get_data()
         
         conn = get_db_connection()
         try:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO operations (date, sum, chat_id, type_operation) VALUES (%s, %s, %s, %s)",
-                (message.text, data['sum'], message.chat.id, data['type_operation'])
-            )
-            conn.commit()
+            with track_call('db', 'add_operation'):
+                cur = conn.cursor()
+                cur.execute(
+                    "INSERT INTO operations (date, sum, chat_id, type_operation) VALUES (%s, %s, %s, %s)",
+                    (op_date, data['sum'], message.chat.id, data['type_operation'])
+                )
+                # Итоги обновляются в той же транзакции, что и вставка операции
+                record_operations(cur, [(message.chat.id, op_date, data['sum'], data['type_operation'])])
+                conn.commit()
             await message.answer("Операция успешно добавлена!")
         except Exception as e:
-            logging.error(f"Ошибка при добавлении операции: {e}")
+            logging.error("Ошибка при добавлении операции: %s", e)
             await message.answer("Произошла ошибка при добавлении операции")
         finally:
             conn.close()
@@ -210,64 +299,285 @@ async def process_currency(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(FinanceStates.waiting_for_sort_order)
     await callback.answer()
 
-# Обработчик выбора сортировки
+# Получение страницы операций пользователя с пагинацией по ключу (date, id).
+# Запрос читает не больше page_size + 1 строк по индексу.
+# direction "n" - страница после курсора, "p" - перед курсором.
+@timed('db')
+def fetch_operations_page(chat_id, sort_order, cursor=None, direction="n"):
+    forward = direction == "n"
+    ascending = (sort_order == "ASC") == forward
+    query = "SELECT id, date, sum, type_operation FROM operations WHERE chat_id = %s"
+    params = [chat_id]
+    if cursor is not None:
+        query += f" AND (date, id) {'>' if ascending else '<'} (%s, %s)"
+        params.extend(cursor)
+    query += f" ORDER BY date {'ASC' if ascending else 'DESC'}, id {'ASC' if ascending else 'DESC'} LIMIT %s"
+    params.append(OPERATIONS_PAGE_SIZE + 1)
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    has_more = len(rows) > OPERATIONS_PAGE_SIZE
+    rows = rows[:OPERATIONS_PAGE_SIZE]
+    if not forward:
+        rows.reverse()
+    # Страница перед курсором всегда имеет следующую, страница после курсора - предыдущую
+    has_prev = has_more if not forward else cursor is not None
+    has_next = has_more if forward else True
+    return rows, has_prev, has_next
+
+# Текст и кнопки навигации для страницы операций; каждая сумма пересчитывается по курсу на свою дату
+def render_operations_page(currency, sort_order, rows, rates, has_prev, has_next):
+    lines = [f"Ваши операции ({currency}):", ""]
+    lines.extend(f"{op_date}: {convert_sum(op_sum, rates[op_date])} {currency} ({type_operation})"
+                 for _, op_date, op_sum, type_operation in rows)
+
+    buttons = []
+    if has_prev:
+        first_id, first_date = rows[0][0], rows[0][1]
+        buttons.append(InlineKeyboardButton(
+            text="< Назад", callback_data=f"ops:{currency}:{sort_order}:p:{first_date}:{first_id}"))
+    if has_next:
+        last_id, last_date = rows[-1][0], rows[-1][1]
+        buttons.append(InlineKeyboardButton(
+            text="Вперед >", callback_data=f"ops:{currency}:{sort_order}:n:{last_date}:{last_id}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), keyboard
+
+# Обработчик выбора сортировки: первая страница операций
 @dp.callback_query(FinanceStates.waiting_for_sort_order)
 async def process_sort_order(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     currency = data['currency']
-    sort_order = callback.data
+    sort_order = "ASC" if callback.data == "ASC" else "DESC"
     
     try:
-        # Получаем курс валюты, если нужно
-        rate = 1.0
-        if currency != "RUB":
-            response = requests.get(f"http://localhost:5003/rate?currency={currency}")
-
-            # Проверка статуса ответа и обработка ошибок
-            if response.status_code == 500:
-                await callback.message.answer("Внутренняя ошибка сервиса. Попробуйте позже.")
-                return
-            # Если статус другой, то проверяем на успешный ответ
-            if response.status_code != 200:
-                await callback.message.answer("Не удалось получить курс валюты")
-                return
-            # Получаем курс из ответа
-            rate = response.json().get('rate', 1.0)
-
-        # Получаем операции из БД
-        conn = get_db_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                f"SELECT date, sum, type_operation FROM operations WHERE chat_id = %s ORDER BY date {sort_order}",
-                (callback.message.chat.id,)
-            )
-            operations = cur.fetchall()
-            
-            if not operations:
-                await callback.message.answer("У вас пока нет операций")
-                return
-            
-            # Формируем сообщение
-            message_text = f"Ваши операции ({currency}):\n\n"
-            for op in operations:
-                converted_sum = round(float(op[1]) / rate, 2)
-                message_text += f"{op[0]}: {converted_sum} {currency} ({op[2]})\n"
-            
-            await callback.message.answer(message_text)
-        finally:
-            conn.close()
+        rows, has_prev, has_next = await asyncio.to_thread(
+            fetch_operations_page, callback.message.chat.id, sort_order)
+        if not rows:
+            await callback.message.answer("У вас пока нет операций")
+            return
+
+        rates = await asyncio.to_thread(fetch_rates, currency, [row[1] for row in rows])
+        text, keyboard = render_operations_page(currency, sort_order, rows, rates, has_prev, has_next)
+        await callback.message.answer(text, reply_markup=keyboard)
+    except RateServiceError as e:
+        await callback.message.answer(str(e))
     except Exception as e:
-        logging.error(f"Ошибка при получении операций: {e}")
+        logging.error("Ошибка при получении операций: %s", e)
         await callback.message.answer("Произошла ошибка при получении операций")
     finally:
         await state.clear()
     await callback.answer()
 
+# Обработчик кнопок навигации по страницам операций
+@dp.callback_query(F.data.startswith("ops:"))
+async def process_operations_page(callback: types.CallbackQuery):
+    try:
+        _, currency, sort_order, direction, cursor_date, cursor_id = callback.data.split(":")
+        cursor = (datetime.strptime(cursor_date, "%Y-%m-%d").date(), int(cursor_id))
+        if sort_order not in ("ASC", "DESC") or direction not in ("n", "p"):
+            raise ValueError
+    except ValueError:
+        await callback.answer("Некорректная страница")
+        return
+
+    try:
+        rows, has_prev, has_next = await asyncio.to_thread(
+            fetch_operations_page, callback.message.chat.id, sort_order, cursor, direction)
+        if not rows:
+            await callback.answer("Больше операций нет")
+            return
+
+        rates = await asyncio.to_thread(fetch_rates, currency, [row[1] for row in rows])
+        text, keyboard = render_operations_page(currency, sort_order, rows, rates, has_prev, has_next)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except RateServiceError as e:
+        await callback.answer(str(e))
+        return
+    except Exception as e:
+        logging.error("Ошибка при получении операций: %s", e)
+        await callback.message.answer("Произошла ошибка при получении операций")
+    await callback.answer()
+
+# Обработчик команды /summary: баланс и итоги по месяцам из готовых агрегатов
+@dp.message(Command("summary"))
+async def summary_command(message: types.Message):
+    if not await is_user_registered(message.chat.id):
+        await message.answer("Сначала зарегистрируйтесь с помощью /reg")
+        return
+
+    conn = get_db_connection()
+    try:
+        with track_call('db', 'fetch_summary'):
+            summary = fetch_summary(conn.cursor(), message.chat.id, SUMMARY_MONTHS)
+    except Exception as e:
+        logging.error("Ошибка при получении сводки: %s", e)
+        await message.answer("Произошла ошибка при получении сводки")
+        return
+    finally:
+        conn.close()
+
+    if summary is None:
+        await message.answer("У вас пока нет операций")
+        return
+
+    lines = [
+        f"Баланс: {summary['balance']} руб.",
+        f"Доходы: {summary['income']} руб., расходы: {summary['expense']} руб. "
+        f"(операций: {summary['count']})",
+        "",
+        "По месяцам:",
+    ]
+    lines.extend(
+        f"{period['month']:%Y-%m}: +{period['income']} / -{period['expense']}, "
+        f"остаток {period['closing_balance']} руб."
+        for period in summary['periods']
+    )
+    await message.answer("\n".join(lines))
+
+# Обработчик команды /import
+@dp.message(Command("import"))
+async def import_command(message: types.Message, state: FSMContext):
+    if not await is_user_registered(message.chat.id):
+        await message.answer("Сначала зарегистрируйтесь с помощью /reg")
+        return
+
+    await message.answer(
+        "Отправьте файл с операциями:\n"
+        "- CSV со столбцами дата;сумма;тип (тип - ДОХОД или РАСХОД; без него тип определяется по знаку суммы)\n"
+        "- банковскую выписку OFX"
+    )
+    await state.set_state(FinanceStates.waiting_for_import_file)
+
+# Разбор файла и вставка операций (выполняется в отдельном потоке)
+@timed('db')
+def import_statement_file(chat_id, filename, file):
+    conn = get_db_connection()
+    try:
+        return import_operations(conn, chat_id, parse_statement(filename, file))
+    finally:
+        conn.close()
+
+# Обработчик загруженного файла с операциями
+@dp.message(FinanceStates.waiting_for_import_file, F.document)
+async def process_import_file(message: types.Message, state: FSMContext):
+    document = message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await message.answer("Файл слишком большой, максимум 20 МБ")
+        return
+
+    await message.answer("Файл получен, импортирую операции...")
+    try:
+        # Файл скачивается во временный файл на диске и читается построчно
+        with tempfile.TemporaryFile() as file:
+            await bot.download(document, destination=file)
+            file.seek(0)
+            report = await asyncio.to_thread(
+                import_statement_file, message.chat.id, document.file_name or "", file)
+    except Exception as e:
+        logging.error("Ошибка при импорте операций: %s", e)
+        await message.answer("Произошла ошибка при импорте, операции не добавлены")
+        await state.clear()
+        return
+
+    lines = [f"Импортировано операций: {report.imported}", f"Отклонено строк: {report.rejected}"]
+    lines.extend(f"- строка {line_no}: {reason}" for line_no, reason in report.errors)
+    if report.rejected > len(report.errors):
+        lines.append(f"... и еще {report.rejected - len(report.errors)}")
+    await message.answer("\n".join(lines))
+    await state.clear()
+
+# Обработчик сообщения без файла в режиме импорта
+@dp.message(FinanceStates.waiting_for_import_file)
+async def process_import_not_file(message: types.Message):
+    await message.answer("Отправьте файл CSV или OFX документом")
+
+# Разбор аргументов /export: формат, валюта и период в любом порядке
+def parse_export_args(args):
+    options = {'fmt': 'csv', 'currency': 'RUB', 'date_from': None, 'date_to': None}
+    dates = []
+    for token in (args or "").split():
+        if token.lower() in ("csv", "xlsx"):
+            options['fmt'] = token.lower()
+        elif token.upper() in ("RUB", "USD", "EUR"):
+            options['currency'] = token.upper()
+        else:
+            dates.append(datetime.strptime(token, "%Y-%m-%d").date())
+    if len(dates) > 2:
+        raise ValueError
+    if dates:
+        options['date_from'] = dates[0]
+    if len(dates) == 2:
+        options['date_to'] = dates[1]
+    return options
+
+# Выгрузка операций во временный файл (выполняется в отдельном потоке).
+# Курсы запрашиваются у сервиса для каждой порции строк, прочитанной из курсора
+@timed('db')
+def export_to_file(chat_id, path, options):
+    conn = get_db_connection()
+    try:
+        with open(path, "wb") as file:
+            return export_operations(
+                conn, file, chat_id,
+                rate_lookup=lambda dates: fetch_rates(options['currency'], dates),
+                **options
+            )
+    finally:
+        conn.close()
+
+# Обработчик команды /export [csv|xlsx] [RUB|USD|EUR] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]
+@dp.message(Command("export"))
+async def export_command(message: types.Message, command: CommandObject):
+    if not await is_user_registered(message.chat.id):
+        await message.answer("Сначала зарегистрируйтесь с помощью /reg")
+        return
+
+    try:
+        options = parse_export_args(command.args)
+    except ValueError:
+        await message.answer(
+            "Использование: /export [csv|xlsx] [RUB|USD|EUR] [ГГГГ-ММ-ДД] [ГГГГ-ММ-ДД]\n"
+            "Например: /export xlsx USD 2024-01-01 2024-12-31"
+        )
+        return
+    if options['fmt'] not in available_formats():
+        await message.answer("Выгрузка в XLSX недоступна, используйте csv")
+        return
+
+    # Файл формируется на диске построчно, поэтому память не зависит от числа операций
+    fd, path = tempfile.mkstemp(suffix=f".{options['fmt']}")
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(export_to_file, message.chat.id, path, options)
+        if count == 0:
+            await message.answer("Нет операций за выбранный период")
+            return
+        await message.answer_document(
+            FSInputFile(path, filename=f"operations_{options['currency']}.{options['fmt']}"),
+            caption=f"Операций: {count}"
+        )
+    except RateServiceError as e:
+        await message.answer(str(e))
+    except Exception as e:
+        logging.error("Ошибка при выгрузке операций: %s", e)
+        await message.answer("Произошла ошибка при выгрузке операций")
+    finally:
+        os.remove(path)
+
 # Запуск бота
 async def main():
     create_tables()
-    await dp.start_polling(bot)
+    if webhook_url:
+        await run_webhook(dp, bot, webhook_url)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,122 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+INCOME = "ДОХОД"
+EXPENSE = "РАСХОД"
+
+# Агрегаты по операциям пользователя: итоги за каждый месяц и общий баланс.
+# Обновляются в той же транзакции, что и вставка операций, поэтому
+# отчеты читают несколько готовых строк вместо просмотра всех операций.
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS monthly_summaries (
+        chat_id BIGINT NOT NULL,
+        month DATE NOT NULL,
+        income NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        expense NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        operations_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, month)
+    );
+
+    CREATE TABLE IF NOT EXISTS balances (
+        chat_id BIGINT PRIMARY KEY,
+        income NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        expense NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        operations_count INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+
+# Создание таблиц агрегатов; при первом создании они заполняются по уже сохраненным операциям
+def create_summary_tables(cur):
+    cur.execute("SELECT to_regclass('balances') IS NULL")
+    is_new = cur.fetchone()[0]
+    cur.execute(SCHEMA_SQL)
+    if is_new:
+        rebuild_summaries(cur)
+
+
+# Полный пересчет агрегатов по таблице operations
+def rebuild_summaries(cur):
+    cur.execute("TRUNCATE monthly_summaries, balances")
+    cur.execute(f"""
+        INSERT INTO monthly_summaries (chat_id, month, income, expense, operations_count)
+        SELECT chat_id, date_trunc('month', date)::date,
+               COALESCE(SUM(sum) FILTER (WHERE type_operation = '{INCOME}'), 0),
+               COALESCE(SUM(sum) FILTER (WHERE type_operation = '{EXPENSE}'), 0),
+               COUNT(*)
+        FROM operations
+        GROUP BY 1, 2
+    """)
+    cur.execute("""
+        INSERT INTO balances (chat_id, income, expense, operations_count)
+        SELECT chat_id, SUM(income), SUM(expense), SUM(operations_count)
+        FROM monthly_summaries
+        GROUP BY chat_id
+    """)
+
+
+# Учет новых операций в агрегатах; operations - последовательность (chat_id, date, sum, type_operation).
+# Операции сначала группируются, поэтому на пакет выполняется два запроса независимо от его размера.
+def record_operations(cur, operations):
+    months = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+    for chat_id, op_date, amount, type_operation in operations:
+        totals = months[(chat_id, op_date.replace(day=1))]
+        totals[0 if type_operation == INCOME else 1] += Decimal(str(amount))
+        totals[2] += 1
+    if not months:
+        return
+
+    balances = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+    for (chat_id, _), (income, expense, count) in months.items():
+        totals = balances[chat_id]
+        totals[0] += income
+        totals[1] += expense
+        totals[2] += count
+
+    execute_values(cur, """
+        INSERT INTO monthly_summaries AS s (chat_id, month, income, expense, operations_count)
+        VALUES %s
+        ON CONFLICT (chat_id, month) DO UPDATE SET
+            income = s.income + EXCLUDED.income,
+            expense = s.expense + EXCLUDED.expense,
+            operations_count = s.operations_count + EXCLUDED.operations_count
+    """, [(chat_id, month, *totals) for (chat_id, month), totals in sorted(months.items())])
+    execute_values(cur, """
+        INSERT INTO balances AS b (chat_id, income, expense, operations_count)
+        VALUES %s
+        ON CONFLICT (chat_id) DO UPDATE SET
+            income = b.income + EXCLUDED.income,
+            expense = b.expense + EXCLUDED.expense,
+            operations_count = b.operations_count + EXCLUDED.operations_count
+    """, [(chat_id, *totals) for chat_id, totals in sorted(balances.items())])
+
+
+# Баланс и итоги последних months месяцев; для каждого месяца считается остаток на конец месяца
+def fetch_summary(cur, chat_id, months=12):
+    cur.execute("SELECT income, expense, operations_count FROM balances WHERE chat_id = %s", (chat_id,))
+    balance_row = cur.fetchone()
+    if balance_row is None:
+        return None
+
+    cur.execute(
+        "SELECT month, income, expense, operations_count FROM monthly_summaries "
+        "WHERE chat_id = %s ORDER BY month DESC LIMIT %s",
+        (chat_id, months)
+    )
+    income, expense, count = balance_row
+    closing = income - expense
+    periods = []
+    for month, month_income, month_expense, month_count in cur.fetchall():
+        periods.append({
+            'month': month,
+            'income': month_income,
+            'expense': month_expense,
+            'count': month_count,
+            'closing_balance': closing,
+        })
+        closing -= month_income - month_expense
+
+    return {'income': income, 'expense': expense, 'balance': income - expense,
+            'count': count, 'periods': periods}
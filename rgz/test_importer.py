@@ -0,0 +1,86 @@
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from importer import RowError, ImportReport, MAX_REPORTED_ERRORS, parse_amount, parse_date, parse_statement
+from summaries import INCOME, EXPENSE
+
+
+def parse(filename, text):
+    return list(parse_statement(filename, io.BytesIO(text.encode('utf-8'))))
+
+
+# Тест CSV с разделителем "," и заголовком
+def test_csv_comma_delimiter():
+    rows = parse("statement.csv", "date,sum,type\n2024-01-05,100.50,income\n2024-01-06,-20,\n")
+    assert rows == [
+        (2, (date(2024, 1, 5), Decimal("100.50"), INCOME)),
+        (3, (date(2024, 1, 6), Decimal("20.00"), EXPENSE)),
+    ]
+
+# Тест CSV с разделителем ";" и десятичной запятой
+def test_csv_semicolon_with_decimal_comma():
+    rows = parse("statement.csv", "Дата;Сумма;Тип\n01.02.2024;1 234,56;расход\n02.02.2024;7,5\n")
+    assert rows == [
+        (2, (date(2024, 2, 1), Decimal("1234.56"), EXPENSE)),
+        (3, (date(2024, 2, 2), Decimal("7.50"), INCOME)),
+    ]
+
+# Тест десятичной запятой в кавычках при разделителе ","
+def test_csv_quoted_decimal_comma():
+    rows = parse("statement.csv", '2024-01-05,"12,50",debit\n')
+    assert rows == [(1, (date(2024, 1, 5), Decimal("12.50"), EXPENSE))]
+
+# Тест отклонения некорректных строк: остальные строки разбираются, пустые пропускаются
+def test_csv_rejected_rows():
+    rows = parse("statement.csv", "2024-01-05,abc\n\n2024-13-01,10\n2024-01-05,10,gift\n2024-01-05\n2024-01-07,5\n")
+    assert [line_no for line_no, _ in rows] == [1, 3, 4, 5, 6]
+    assert all(isinstance(result, RowError) for _, result in rows[:4])
+    assert rows[4] == (6, (date(2024, 1, 7), Decimal("5.00"), INCOME))
+
+# Тест OFX в формате SGML (теги без закрывающих пар, BOM в начале файла)
+def test_ofx_sgml():
+    text = ("\ufeffOFXHEADER:100\n<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>DEBIT\n"
+            "<DTPOSTED>20240105120000[+3:MSK]\n<TRNAMT>-12.50\n</STMTTRN>\n</BANKTRANLIST></OFX>\n")
+    assert parse("statement.ofx", text) == [(7, (date(2024, 1, 5), Decimal("12.50"), EXPENSE))]
+
+# Тест OFX в формате XML: несколько транзакций в одной строке
+def test_ofx_xml():
+    text = ("<OFX><STMTTRN><DTPOSTED>20240106</DTPOSTED><TRNAMT>100</TRNAMT></STMTTRN>"
+            "<STMTTRN><DTPOSTED>20240107</DTPOSTED><TRNAMT>-3.1</TRNAMT></STMTTRN></OFX>\n")
+    assert parse("STATEMENT.QFX", text) == [
+        (1, (date(2024, 1, 6), Decimal("100.00"), INCOME)),
+        (1, (date(2024, 1, 7), Decimal("3.10"), EXPENSE)),
+    ]
+
+# Тест отклонения транзакций OFX без даты, с некорректной датой или суммой
+def test_ofx_rejected_transactions():
+    text = ("<STMTTRN><TRNAMT>5</TRNAMT></STMTTRN>\n"
+            "<STMTTRN><DTPOSTED>2024XX01<TRNAMT>5</STMTTRN>\n"
+            "<STMTTRN><DTPOSTED>20240101<TRNAMT>0</STMTTRN>\n")
+    rows = parse("statement.ofx", text)
+    assert [line_no for line_no, _ in rows] == [1, 2, 3]
+    assert all(isinstance(result, RowError) for _, result in rows)
+
+# Тест проверки суммы: ноль, слишком большие и нечисловые значения отклоняются
+def test_parse_amount():
+    assert parse_amount(" -1 000,25 ") == Decimal("-1000.25")
+    for value in ("0", "100000000", "NaN", "Infinity", "12a"):
+        with pytest.raises(RowError):
+            parse_amount(value)
+
+# Тест проверки даты: оба формата CSV и запрет дат в будущем
+def test_parse_date():
+    assert parse_date("2024-03-01") == date(2024, 3, 1)
+    assert parse_date("01.03.2024") == date(2024, 3, 1)
+    with pytest.raises(RowError):
+        parse_date((date.today() + timedelta(days=1)).isoformat())
+
+# Тест ограничения числа ошибок в отчете
+def test_report_limits_errors():
+    report = ImportReport()
+    for line_no in range(MAX_REPORTED_ERRORS + 5):
+        report.reject(line_no, "ошибка")
+    assert report.rejected == MAX_REPORTED_ERRORS + 5
+    assert len(report.errors) == MAX_REPORTED_ERRORS